@@ -0,0 +1,80 @@
+import argparse
+import os
+import tempfile
+import threading
+import time
+
+from benchmarks.fake_ollama import FakeOllamaServer
+from benchmarks.synthetic_pdf import make_pdf
+from cluster_preprocess import ClusterPreprocessor
+from document_text import DocumentText
+from documents import DocumentRegistry
+
+
+def complete(document_text):
+    # 每页的译文段数与原文一致且有总结
+    for page_index in range(document_text.document.last_page + 1):
+        english = document_text.paragraphs[page_index]
+        if english and (len(document_text.translated_paragraphs[page_index]) != len(english)
+                        or not document_text.page_summary_200[page_index]):
+            return False
+    return True
+
+
+def run(pdf_path, servers, concurrency, kill_after):
+    # 每次在新的临时目录里处理，不复用上一次的预处理日志
+    original_directory = os.getcwd()
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+        try:
+            document = DocumentRegistry().register(pdf_path)
+            document_text = DocumentText(document)
+            cluster = ClusterPreprocessor(document_text, [server.url for server in servers], "fake-model",
+                                          concurrency=concurrency)
+            killer = None
+            if kill_after is not None and len(servers) > 1:
+                # 模拟一台机器中途掉线：停止最后一个服务，之后的连接都会被拒绝
+                killer = threading.Timer(kill_after, servers[-1].stop)
+                killer.start()
+            start = time.perf_counter()
+            failed_pages = cluster.run()
+            elapsed = time.perf_counter() - start
+            if killer is not None:
+                killer.cancel()
+            print(cluster.report())
+            print(f"{len(servers)} endpoint(s): {elapsed:.2f} s, complete: {complete(document_text)}, "
+                  f"unfinished pages: {len(failed_pages)}\n")
+            document_text.close()
+            return elapsed
+        finally:
+            os.chdir(original_directory)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="多节点分片预处理：单节点 vs 多个本地模拟 Ollama 节点")
+    parser.add_argument("--pages", type=int, default=40)
+    parser.add_argument("--token-rates", type=float, nargs="+", default=[400.0, 200.0, 100.0],
+                        help="每个模拟节点的生成速度，节点数等于给出的个数")
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--parallel", type=int, default=2)
+    parser.add_argument("--concurrency", type=int, default=2)
+    parser.add_argument("--kill-after", type=float, default=None, help="多节点运行中，在这么多秒后停掉最后一个节点")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        pdf_path = make_pdf(os.path.join(directory, "synthetic.pdf"), pages=args.pages)
+        with FakeOllamaServer(latency=args.latency, token_rate=args.token_rates[0], parallel=args.parallel) as server:
+            single = run(pdf_path, [server], args.concurrency, None)
+        servers = [FakeOllamaServer(latency=args.latency, token_rate=token_rate, parallel=args.parallel).start()
+                   for token_rate in args.token_rates]
+        try:
+            multiple = run(pdf_path, servers, args.concurrency, args.kill_after)
+        finally:
+            # 已经被停掉的节点再次 stop 不会阻塞
+            for server in servers:
+                server.stop()
+        print(f"speedup: {single / multiple:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
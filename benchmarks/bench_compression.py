@@ -0,0 +1,50 @@
+import argparse
+import time
+
+from benchmarks.bench_packing import load_pages
+from benchmarks.fake_ollama import FakeOllamaServer
+from llm import LanguageProcessor
+from tracing import tracer
+from utils import estimate_tokens
+
+
+def run(host, pages, compress_summaries):
+    language_unit = LanguageProcessor("fake-model", host=host, response_cache_path=None,
+                                      compress_summaries=compress_summaries, translation_memory_path=None)
+    start = time.perf_counter()
+    for page in pages:
+        language_unit.summarize_all(page)
+    elapsed = time.perf_counter() - start
+    prompt_tokens = sum(item["prompt_tokens"] for item in language_unit.llm.call_stats)
+    return elapsed, prompt_tokens
+
+
+def main():
+    parser = argparse.ArgumentParser(description="总结前的抽取式压缩：压缩率、压缩耗时与端到端节省的时间（本地模拟 Ollama）")
+    parser.add_argument("--paragraphs", type=int, default=120)
+    parser.add_argument("--latency", type=float, default=0.02)
+    parser.add_argument("--prompt-rate", type=float, default=500.0, help="模拟的 prefill 速度（token/秒）")
+    parser.add_argument("--token-rate", type=float, default=400.0)
+    parser.add_argument("--source", default="processed_texts.json")
+    args = parser.parse_args()
+
+    pages = load_pages(args.source, args.paragraphs)
+    original_tokens = sum(estimate_tokens(paragraph) for page in pages for paragraph in page)
+    with FakeOllamaServer(latency=args.latency, token_rate=args.token_rate, prompt_rate=args.prompt_rate) as server:
+        plain_seconds, plain_tokens = run(server.url, pages, False)
+        compressed_seconds, compressed_tokens = run(server.url, pages, True)
+    rows, _ = tracer.summary()
+    compress_count, compress_ms = next(((count, average_ms) for name, count, average_ms, _, _ in rows
+                                        if name == "context.compress"), (0, 0.0))
+    print(f"{len(pages)} pages, {original_tokens} page tokens")
+    print(f"{'mode':>10} {'prompt tok':>10} {'seconds':>8}")
+    print(f"{'plain':>10} {plain_tokens:>10} {plain_seconds:>8.2f}")
+    print(f"{'compressed':>10} {compressed_tokens:>10} {compressed_seconds:>8.2f}")
+    print(f"prompt tokens kept: {compressed_tokens / plain_tokens:.0%}, "
+          f"compression: {compress_count} calls, {compress_ms:.2f} ms each, "
+          f"end-to-end saved: {plain_seconds - compressed_seconds:.2f} s "
+          f"({1 - compressed_seconds / plain_seconds:.0%})")
+
+
+if __name__ == "__main__":
+    main()
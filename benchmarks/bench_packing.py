@@ -0,0 +1,75 @@
+import argparse
+import json
+import time
+
+from benchmarks.fake_ollama import FakeOllamaServer
+from llm import LanguageProcessor
+from scheduler import LLMScheduler
+from utils import pack_paragraphs
+
+
+def load_pages(path, limit):
+    with open(path, "r") as f:
+        data = json.load(f)
+    pages = []
+    count = 0
+    for page in data["English"]:
+        if count >= limit:
+            break
+        page = page[:limit - count]
+        if page:
+            pages.append(page)
+            count += len(page)
+    return pages
+
+
+def run(language_unit, pages, concurrency, token_budget, max_segments):
+    # token_budget 为 0 时逐段翻译
+    llm = language_unit.llm
+    llm.call_stats.clear()
+    start = time.perf_counter()
+    with LLMScheduler(max_workers=concurrency, base_delay=0.05) as scheduler:
+        futures = []
+        for page in pages:
+            if token_budget:
+                batches = pack_paragraphs(page, token_budget, max_segments)
+            else:
+                batches = [[paragraph] for paragraph in page]
+            futures += [scheduler.submit(language_unit.translate_batch, batch) for batch in batches]
+        outputs = [translation for future in futures for translation in future.result()]
+    elapsed = time.perf_counter() - start
+    prompt_tokens = sum(item["prompt_tokens"] for item in llm.call_stats)
+    return elapsed, len(llm.call_stats), prompt_tokens, outputs
+
+
+def main():
+    parser = argparse.ArgumentParser(description="翻译吞吐量：逐段请求 vs 打包请求（本地模拟 Ollama）")
+    parser.add_argument("--paragraphs", type=int, default=64)
+    parser.add_argument("--budgets", type=int, nargs="+", default=[0, 300, 600, 1200],
+                        help="每批的 token 预算，0 表示逐段翻译")
+    parser.add_argument("--max-segments", type=int, default=8)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--token-rate", type=float, default=400.0)
+    parser.add_argument("--parallel", type=int, default=4)
+    parser.add_argument("--source", default="processed_texts.json")
+    args = parser.parse_args()
+
+    pages = load_pages(args.source, args.paragraphs)
+    paragraph_count = sum(len(page) for page in pages)
+    with FakeOllamaServer(latency=args.latency, token_rate=args.token_rate, parallel=args.parallel) as fake_server:
+        language_unit = LanguageProcessor("fake-model", host=fake_server.url, response_cache_path=None,
+                                          translation_memory_path=None)
+        baseline = None
+        print(f"{'budget':>6} {'requests':>8} {'prompt tok':>10} {'seconds':>8} {'para/s':>8} {'speedup':>8}  aligned")
+        for token_budget in args.budgets:
+            elapsed, requests, prompt_tokens, outputs = run(language_unit, pages, args.concurrency, token_budget,
+                                                            args.max_segments)
+            if baseline is None:
+                baseline = elapsed
+            print(f"{token_budget or 'single':>6} {requests:>8} {prompt_tokens:>10} {elapsed:>8.2f} "
+                  f"{paragraph_count / elapsed:>8.1f} {baseline / elapsed:>8.2f}  {len(outputs) == paragraph_count}")
+
+
+if __name__ == "__main__":
+    main()
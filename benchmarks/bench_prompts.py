@@ -0,0 +1,67 @@
+import argparse
+import json
+import statistics
+
+from benchmarks.fake_ollama import FakeOllamaServer
+from llm import LanguageProcessor
+
+
+def legacy_translate(llm, text_english):
+    # 改动前的 translate：先发一轮只有指令的对话并等待完整回复，再发送正文
+    message_history = []
+    requirements = """
+            1. The translation into simplified Chinese must be easily understood.\n
+            2. Only output the translated text. Extra information is unwanted.\n
+            """
+    prompt = (f"In the next turn of conversation, you will be given a piece of text in English. You are "
+              f"supposed to translate it into simplified Chinese. And you must follow the requirements as "
+              f"follows: \n {requirements}")
+    llm(prompt, message_history)
+    content = f"The text in English is as follows: \n {text_english}"
+    return llm(content, message_history)
+
+
+def report(name, paragraph_count, call_stats):
+    call_stats = list(call_stats)
+    latency = [item["latency_ms"] for item in call_stats]
+    prompt_tokens = sum(item["prompt_tokens"] for item in call_stats)
+    completion_tokens = sum(item["completion_tokens"] for item in call_stats)
+    print(f"{name:>8} {len(call_stats) / paragraph_count:>10.1f} {prompt_tokens / paragraph_count:>13.1f} "
+          f"{completion_tokens / paragraph_count:>13.1f} {sum(latency) / paragraph_count:>13.1f} "
+          f"{statistics.median(latency):>11.1f}")
+
+
+def run(host, model_name, paragraphs):
+    language_unit = LanguageProcessor(model_name, host=host, response_cache_path=None, translation_memory_path=None)
+    language_unit.load_model()
+    llm = language_unit.llm
+    print(f"{'path':>8} {'calls/para':>10} {'prompt tok/para':>13} {'output tok/para':>13} "
+          f"{'ms/para':>13} {'p50 call ms':>11}")
+    for paragraph in paragraphs:
+        legacy_translate(llm, paragraph)
+    report("legacy", len(paragraphs), llm.call_stats)
+    llm.call_stats.clear()
+    for paragraph in paragraphs:
+        language_unit.translate(paragraph)
+    report("template", len(paragraphs), llm.call_stats)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="翻译请求的 token 数与耗时：旧的预热轮 vs system 模板")
+    parser.add_argument("--paragraphs", type=int, default=32)
+    parser.add_argument("--host", default=None, help="真实 Ollama 地址；不填则使用本地模拟服务")
+    parser.add_argument("--model", default="fake-model")
+    parser.add_argument("--source", default="processed_texts.json")
+    args = parser.parse_args()
+
+    with open(args.source, "r") as f:
+        paragraphs = [paragraph for page in json.load(f)["English"] for paragraph in page][:args.paragraphs]
+    if args.host:
+        run(args.host, args.model, paragraphs)
+    else:
+        with FakeOllamaServer(latency=0.02, token_rate=400.0) as fake_server:
+            run(fake_server.url, args.model, paragraphs)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+import argparse
+import json
+import statistics
+import time
+
+from benchmarks.fake_ollama import FakeOllamaServer
+from llm import OllamaLLM
+from retrieval import BookIndex
+
+QUERIES = [
+    "What is the containment problem?",
+    "synthetic biology and DNA printers",
+    "How do nation states respond to the coming wave?",
+    "人工智能会如何改变战争",
+    "作者对监管有什么建议",
+    "artificial capable intelligence",
+    "pessimism aversion",
+    "技术扩散的历史",
+]
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q * (len(values) - 1))))]
+
+
+def measure_queries(index, repeat, k):
+    latency = []
+    for _ in range(repeat):
+        for query in QUERIES:
+            start = time.perf_counter()
+            index.search(query, k)
+            latency.append((time.perf_counter() - start) * 1000)
+    return latency
+
+
+def main():
+    parser = argparse.ArgumentParser(description="全书检索：建索引与查询耗时")
+    parser.add_argument("--source", default="processed_texts.json")
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("-k", type=int, default=5)
+    parser.add_argument("--dense", action="store_true", help="同时建向量索引（使用本地模拟的 embedding 服务）")
+    args = parser.parse_args()
+
+    with open(args.source, "r") as f:
+        data = json.load(f)
+
+    def run(embed_fn, name):
+        start = time.perf_counter()
+        index = BookIndex(data["English"], data["Chinese"], embed_fn=embed_fn)
+        build_ms = (time.perf_counter() - start) * 1000
+        latency = measure_queries(index, args.repeat, args.k)
+        print(f"{name:>12} {len(index):>10} {build_ms:>10.1f} {statistics.mean(latency):>10.3f} "
+              f"{percentile(latency, 0.5):>10.3f} {percentile(latency, 0.95):>10.3f}")
+
+    print(f"{'index':>12} {'paragraphs':>10} {'build ms':>10} {'mean ms':>10} {'p50 ms':>10} {'p95 ms':>10}")
+    run(None, "bm25")
+    if args.dense:
+        with FakeOllamaServer(latency=0.0) as fake_server:
+            llm = OllamaLLM("fake-model", host=fake_server.url)
+            run(llm.embed, "bm25+dense")
+
+
+if __name__ == "__main__":
+    main()
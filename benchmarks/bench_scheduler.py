@@ -0,0 +1,47 @@
+import argparse
+import json
+import time
+
+from benchmarks.fake_ollama import FakeOllamaServer
+from llm import LanguageProcessor
+from scheduler import LLMScheduler
+
+
+def load_paragraphs(path, limit):
+    with open(path, "r") as f:
+        data = json.load(f)
+    paragraphs = [paragraph for page in data["English"] for paragraph in page]
+    return paragraphs[:limit]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="翻译吞吐量 vs 并发数（本地模拟 Ollama）")
+    parser.add_argument("--paragraphs", type=int, default=64)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--token-rate", type=float, default=400.0)
+    parser.add_argument("--parallel", type=int, default=4)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--source", default="processed_texts.json")
+    args = parser.parse_args()
+
+    paragraphs = load_paragraphs(args.source, args.paragraphs)
+    with FakeOllamaServer(latency=args.latency, token_rate=args.token_rate, parallel=args.parallel,
+                          failure_rate=args.failure_rate) as fake_server:
+        language_unit = LanguageProcessor("fake-model", host=fake_server.url, response_cache_path=None,
+                                          translation_memory_path=None)
+        baseline = None
+        print(f"{'concurrency':>11} {'seconds':>8} {'para/s':>8} {'speedup':>8}  same order")
+        for concurrency in args.concurrency:
+            start = time.perf_counter()
+            with LLMScheduler(max_workers=concurrency, base_delay=0.05) as scheduler:
+                outputs = scheduler.map(language_unit.translate, paragraphs)
+            elapsed = time.perf_counter() - start
+            if baseline is None:
+                baseline = (elapsed, outputs)
+            print(f"{concurrency:>11} {elapsed:>8.2f} {len(paragraphs) / elapsed:>8.1f} "
+                  f"{baseline[0] / elapsed:>8.2f}  {outputs == baseline[1]}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+
+# 每种加载方式在独立的子进程里运行，RSS 互不干扰
+JSON_LOAD = """
+data = json.load(open({json_path!r}))
+page = data["English"][{page_index}], data["Chinese"][{page_index}], data["200-word summary"][{page_index}]
+"""
+STORE_LOAD = """
+from page_store import PageStore, PageColumn
+store = PageStore({store_path!r})
+page = PageColumn(store, "english")[{page_index}], PageColumn(store, "chinese")[{page_index}], \\
+    PageColumn(store, "summary_200")[{page_index}]
+"""
+MEASURE = """
+import os, time, psutil
+process = psutil.Process()
+base_rss = process.memory_info().rss
+start = time.perf_counter()
+{body}
+elapsed = time.perf_counter() - start
+print(elapsed * 1000, (process.memory_info().rss - base_rss) / 2 ** 20, process.memory_info().rss / 2 ** 20)
+"""
+
+
+def measure(body, repeat):
+    results = []
+    for _ in range(repeat):
+        output = subprocess.run([sys.executable, "-c", MEASURE.format(body=body)], capture_output=True, text=True,
+                                check=True, cwd=os.getcwd()).stdout
+        results.append([float(value) for value in output.split()])
+    return [sorted(column)[len(column) // 2] for column in zip(*results)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="启动加载耗时与内存：整本 JSON vs 按页 SQLite")
+    parser.add_argument("--source", default="processed_texts.json")
+    parser.add_argument("--page", type=int, default=15)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    from page_store import PageStore, migrate_json
+    with tempfile.TemporaryDirectory() as directory:
+        store_path = os.path.join(directory, "processed_texts.db")
+        store = PageStore(store_path)
+        migrate_json(args.source, store)
+        store.close()
+        print(f"{'backend':>8} {'load ms':>10} {'+RSS MiB':>10} {'RSS MiB':>10}  (median of {args.repeat} runs)")
+        for name, template in (("json", JSON_LOAD), ("sqlite", STORE_LOAD)):
+            body = template.format(json_path=os.path.abspath(args.source), store_path=store_path,
+                                   page_index=args.page)
+            load_ms, delta_rss, total_rss = measure(body, args.repeat)
+            print(f"{name:>8} {load_ms:>10.1f} {delta_rss:>10.1f} {total_rss:>10.1f}")
+        print(f"json file {os.path.getsize(args.source) / 2 ** 20:.1f} MiB, "
+              f"sqlite file {os.path.getsize(store_path) / 2 ** 20:.1f} MiB")
+
+
+if __name__ == "__main__":
+    main()
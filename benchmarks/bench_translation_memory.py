@@ -0,0 +1,81 @@
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from benchmarks.fake_ollama import FakeOllamaServer
+from benchmarks.synthetic_pdf import sentence
+from llm import LanguageProcessor
+from translation_memory import format_stats
+from utils import pack_paragraphs
+
+# 近似重复的写法：大小写、弯引号、句末标点、第一个词后加逗号（较短的句子加逗号后达不到模糊匹配的阈值）
+VARIANTS = (
+    lambda text: text.lower(),
+    lambda text: f"“{text[:-1]}”.",
+    lambda text: text[:-1] + "!",
+    lambda text: text.replace(" ", ", ", 1),
+)
+
+
+def make_books(paragraphs, repeat_ratio, variant_ratio, seed):
+    # 第二本书的句子按比例取自第一本书的原句、原句的近似写法，其余是新句子
+    rng = random.Random(seed)
+    first = [[sentence(rng) for _ in range(rng.randint(2, 5))] for _ in range(paragraphs)]
+    pool = [text for paragraph in first for text in paragraph]
+    second = []
+    for _ in range(paragraphs):
+        paragraph = []
+        for _ in range(rng.randint(2, 5)):
+            draw = rng.random()
+            if draw < repeat_ratio:
+                paragraph.append(rng.choice(pool))
+            elif draw < repeat_ratio + variant_ratio:
+                paragraph.append(rng.choice(VARIANTS)(rng.choice(pool)))
+            else:
+                paragraph.append(sentence(rng))
+        second.append(paragraph)
+    return [[" ".join(paragraph) for paragraph in book] for book in (first, second)]
+
+
+def run(language_unit, book):
+    llm = language_unit.llm
+    llm.call_stats.clear()
+    language_unit.set_document("Synthetic Book")
+    start = time.perf_counter()
+    outputs = [translation for batch in pack_paragraphs(book, 600, 8)
+               for translation in language_unit.translate_batch(batch)]
+    elapsed = time.perf_counter() - start
+    tokens = sum(item["prompt_tokens"] + item["completion_tokens"] for item in llm.call_stats)
+    return elapsed, len(llm.call_stats), tokens, len(outputs) == len(book)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="翻译记忆：两本内容有重复的书，逐段翻译 vs 句子级翻译记忆（本地模拟 Ollama）")
+    parser.add_argument("--paragraphs", type=int, default=120)
+    parser.add_argument("--repeat-ratio", type=float, default=0.3)
+    parser.add_argument("--variant-ratio", type=float, default=0.2)
+    parser.add_argument("--latency", type=float, default=0.02)
+    parser.add_argument("--token-rate", type=float, default=2000.0)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    books = make_books(args.paragraphs, args.repeat_ratio, args.variant_ratio, args.seed)
+    with FakeOllamaServer(latency=args.latency, token_rate=args.token_rate) as fake_server, \
+            tempfile.TemporaryDirectory() as directory:
+        baseline = LanguageProcessor("fake-model", host=fake_server.url, response_cache_path=None,
+                                     translation_memory_path=None)
+        with_memory = LanguageProcessor("fake-model", host=fake_server.url, response_cache_path=None,
+                                        translation_memory_path=os.path.join(directory, "translation_memory.db"))
+        print(f"{'book':>4} {'memory':>6} {'requests':>8} {'LLM tok':>8} {'seconds':>8}  aligned")
+        for book_index, book in enumerate(books, 1):
+            for name, language_unit in (("off", baseline), ("on", with_memory)):
+                elapsed, requests, tokens, aligned = run(language_unit, book)
+                print(f"{book_index:>4} {name:>6} {requests:>8} {tokens:>8} {elapsed:>8.2f}  {aligned}")
+            print(format_stats([with_memory.translation_memory]))
+        with_memory.translation_memory.close()
+
+
+if __name__ == "__main__":
+    main()
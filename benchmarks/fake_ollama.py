@@ -0,0 +1,202 @@
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+EMBEDDING_DIMENSION = 256
+
+
+def count_tokens(text):
+    # 粗略估算：英文按空格分词，中文按字计
+    return max(1, len(text.split()) + sum(1 for ch in text if "一" <= ch <= "鿿"))
+
+
+def fake_reply(messages, response_format=None):
+    # 输出只由输入决定，便于比较不同调度方式的结果是否一致
+    content = messages[-1]["content"] if messages else ""
+    digest = hashlib.sha1(json.dumps(messages, ensure_ascii=False).encode("utf-8")).hexdigest()[:8]
+    words = content.split()
+    reply = f"[{digest}] " + " ".join(words[:64])
+    system = " ".join(message.get("content", "") for message in messages if message.get("role") == "system")
+    if "numbered segments" in system:
+        # 打包翻译：每个编号段各自回复，保持编号与顺序
+        segments = re.findall(r"<<(\d+)>>\s*(.*?)(?=\s*<<\d+>>|$)", content, flags=re.S)
+        reply = " ".join(f"<<{number}>> {digest} " + " ".join(text.split()[:64]) for number, text in segments)
+    if response_format == "json":
+        # 要求 JSON 输出时，按提示词里出现的带引号数字键（如多长度总结的 "100"）逐项填充
+        prompt = " ".join(message.get("content", "") for message in messages)
+        keys = list(dict.fromkeys(re.findall(r'"(\d+)"', prompt))) or ["text"]
+        reply = json.dumps({key: reply for key in keys}, ensure_ascii=False)
+    return reply
+
+
+def fake_embedding(text, dimension=EMBEDDING_DIMENSION):
+    # 词袋哈希向量：相同的词落在相同的维度上，检索结果有意义且完全确定
+    vector = [0.0] * dimension
+    for word in re.findall(r"[a-z0-9]+|[一-鿿]", text.lower()):
+        vector[int(hashlib.md5(word.encode("utf-8")).hexdigest(), 16) % dimension] += 1.0
+    return vector
+
+
+class FakeOllamaServer:
+    # 本地模拟的 Ollama HTTP 服务，用于离线压测：
+    # - latency: 每个请求的固定开销（秒），模拟 prefill / 网络往返
+    # - token_rate: 每秒生成的 token 数
+    # - parallel: 同时处理的请求数，模拟 OLLAMA_NUM_PARALLEL，超出的请求排队
+    # - failure_rate: 随机返回 500 的概率，用于验证重试逻辑
+    # - prompt_rate: 每秒 prefill 的 prompt token 数，为 None 时 prefill 只算在 latency 里
+    def __init__(self, host="127.0.0.1", port=0, latency=0.05, token_rate=200.0, parallel=4, failure_rate=0.0,
+                 seed=0, prompt_rate=None):
+        self.latency = latency
+        self.token_rate = token_rate
+        self.prompt_rate = prompt_rate
+        self.failure_rate = failure_rate
+        self.slots = threading.BoundedSemaphore(parallel)
+        self.random = random.Random(seed)
+        self.random_lock = threading.Lock()
+        self.request_count = 0
+        self.server = ThreadingHTTPServer((host, port), self.make_handler())
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def should_fail(self):
+        with self.random_lock:
+            self.request_count += 1
+            return self.random.random() < self.failure_rate
+
+    def make_handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def send_json(self, data, status=200):
+                body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def send_ndjson(self, items):
+                self.send_response(200)
+                self.send_header("Content-Type", "application/x-ndjson")
+                self.end_headers()
+                for item in items:
+                    self.wfile.write((json.dumps(item, ensure_ascii=False) + "\n").encode("utf-8"))
+                    self.wfile.flush()
+
+            def read_json(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                return json.loads(self.rfile.read(length) or b"{}")
+
+            def do_GET(self):
+                if self.path == "/api/tags":
+                    self.send_json({"models": []})
+                elif self.path == "/api/version":
+                    self.send_json({"version": "0.0.0-fake"})
+                else:
+                    self.send_json({"error": "not found"}, 404)
+
+            def do_POST(self):
+                request = self.read_json()
+                if self.path == "/api/pull":
+                    if request.get("stream", True):
+                        self.send_ndjson([{"status": "success"}])
+                    else:
+                        self.send_json({"status": "success"})
+                elif self.path == "/api/chat":
+                    self.chat(request)
+                elif self.path == "/api/embed":
+                    self.embed(request)
+                else:
+                    self.send_json({"error": "not found"}, 404)
+
+            def chat(self, request):
+                if fake.should_fail():
+                    self.send_json({"error": "simulated failure"}, 500)
+                    return
+                messages = request.get("messages") or []
+                reply = fake_reply(messages, request.get("format"))
+                prompt_tokens = sum(count_tokens(message.get("content", "")) for message in messages)
+                reply_tokens = count_tokens(reply)
+                prefill_seconds = fake.latency + (prompt_tokens / fake.prompt_rate if fake.prompt_rate else 0.0)
+                with fake.slots:
+                    start = time.perf_counter()
+                    time.sleep(prefill_seconds + reply_tokens / fake.token_rate)
+                    total_duration = int((time.perf_counter() - start) * 1e9)
+                final = {
+                    "model": request.get("model", ""),
+                    "created_at": datetime.now(timezone.utc).isoformat(),
+                    "message": {"role": "assistant", "content": reply},
+                    "done": True,
+                    "done_reason": "stop",
+                    "total_duration": total_duration,
+                    "load_duration": 0,
+                    "prompt_eval_count": prompt_tokens,
+                    "prompt_eval_duration": int(prefill_seconds * 1e9),
+                    "eval_count": reply_tokens,
+                    "eval_duration": int(reply_tokens / fake.token_rate * 1e9),
+                }
+                if request.get("stream", True):
+                    chunks = []
+                    words = reply.split(" ")
+                    for index, word in enumerate(words):
+                        piece = word if index == len(words) - 1 else word + " "
+                        chunks.append({"model": final["model"], "created_at": final["created_at"],
+                                       "message": {"role": "assistant", "content": piece}, "done": False})
+                    final["message"] = {"role": "assistant", "content": ""}
+                    self.send_ndjson(chunks + [final])
+                else:
+                    self.send_json(final)
+
+            def embed(self, request):
+                texts = request.get("input") or []
+                texts = [texts] if isinstance(texts, str) else texts
+                with fake.slots:
+                    time.sleep(fake.latency)
+                self.send_json({"model": request.get("model", ""),
+                                "embeddings": [fake_embedding(text) for text in texts]})
+
+        return Handler
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="本地模拟 Ollama 服务")
+    parser.add_argument("--port", type=int, default=11435)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--token-rate", type=float, default=200.0)
+    parser.add_argument("--parallel", type=int, default=4)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    args = parser.parse_args()
+    fake_server = FakeOllamaServer(port=args.port, latency=args.latency, token_rate=args.token_rate,
+                                   parallel=args.parallel, failure_rate=args.failure_rate)
+    print(f"fake ollama listening on {fake_server.url}")
+    fake_server.server.serve_forever()
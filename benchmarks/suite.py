@@ -0,0 +1,278 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+from benchmarks.fake_ollama import FakeOllamaServer
+from benchmarks.synthetic_pdf import make_pdf
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+MAIN_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "main.py")
+STARTUP_TIMEOUT = 60
+# 与基线相比，p50 或吞吐量变差超过这个比例时标记为退化
+REGRESSION_THRESHOLD = 0.10
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, max(0, round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+
+class Stage:
+    # 一个阶段的多次计时；work 是每次处理的工作量（页数、段落数、token 数等），用于计算吞吐量
+    def __init__(self, name, unit):
+        self.name = name
+        self.unit = unit
+        self.samples_ms = []
+        self.work = 0
+        self.peak_rss = 0
+
+    @contextmanager
+    def sample(self, work=1):
+        start = time.perf_counter()
+        yield
+        self.samples_ms.append((time.perf_counter() - start) * 1000)
+        self.work += work
+
+    def summary(self):
+        total_seconds = sum(self.samples_ms) / 1000
+        return {
+            "count": len(self.samples_ms),
+            "p50_ms": percentile(self.samples_ms, 0.5),
+            "p90_ms": percentile(self.samples_ms, 0.9),
+            "p99_ms": percentile(self.samples_ms, 0.99),
+            "mean_ms": sum(self.samples_ms) / len(self.samples_ms) if self.samples_ms else 0.0,
+            "throughput": self.work / total_seconds if total_seconds else 0.0,
+            "unit": f"{self.unit}/s",
+            "peak_rss_mb": self.peak_rss / 2 ** 20,
+        }
+
+
+class RssSampler:
+    # 在后台线程里定时采样进程 RSS，记录峰值；不像 tracemalloc 那样拖慢被测代码，且包含 Qt / SQLite 的原生内存
+    def __init__(self, interval=0.005):
+        import psutil
+        self.process = psutil.Process()
+        self.interval = interval
+        self.peak = self.process.memory_info().rss
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.peak = max(self.peak, self.process.memory_info().rss)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stopped.set()
+        self.thread.join()
+        self.peak = max(self.peak, self.process.memory_info().rss)
+
+
+@contextmanager
+def stage(stages, name, unit):
+    current = Stage(name, unit)
+    with RssSampler() as sampler:
+        try:
+            yield current
+        finally:
+            stages[name] = current
+    current.peak_rss = sampler.peak
+
+
+def bench_extraction(stages, document, repeat):
+    from document_text import DocumentText
+    document_text = DocumentText(document)
+    page_count = document.last_page - document.first_page + 1
+    with stage(stages, "extraction", "pages") as current:
+        for _ in range(repeat):
+            with current.sample(page_count):
+                document_text.setup()
+    return document_text
+
+
+def bench_load(stages, document_text, directory, repeat):
+    from page_store import PageStore, PageColumn, migrate_json
+    document_text.save()
+    json_path = document_text.document.processed_text_path
+    page_index = document_text.document.first_page
+    with stage(stages, "json_load", "loads") as current:
+        for attempt in range(repeat):
+            store_path = os.path.join(directory, f"load_{attempt}.db")
+            with current.sample():
+                store = PageStore(store_path)
+                migrate_json(json_path, store)
+                PageColumn(store, "english")[page_index]
+            store.close()
+
+
+def bench_llm(stages, language_unit, paragraphs):
+    llm = language_unit.llm
+    llm.call_stats.clear()
+    with stage(stages, "llm_round_trip", "completion tokens") as current:
+        for paragraph in paragraphs:
+            language_unit.translate(paragraph)
+        current.samples_ms = [item["latency_ms"] for item in llm.call_stats]
+        current.work = sum(item["completion_tokens"] for item in llm.call_stats)
+
+
+def bench_show_page(stages, pdf_path, pages):
+    import main
+    from PyQt6.QtWidgets import QApplication
+    main.LAZY_PREPROCESS = False
+    app = QApplication.instance()
+    viewer = main.PDFViewer("fake-model", pdf_path)
+    document = viewer.document
+    page_indices = [index for index in range(document.first_page, document.last_page + 1)][:pages]
+    # 冷：丢掉全部预渲染后逐页显示；热：等后台预渲染完成后再翻到下一页
+    with stage(stages, "show_page_cold", "pages") as current:
+        for page_index in page_indices:
+            viewer.invalidate_page()
+            viewer.current_page = page_index
+            with current.sample():
+                viewer.show_page(page_index)
+    with stage(stages, "show_page_prefetched", "pages") as current:
+        for page_index in page_indices:
+            deadline = time.perf_counter() + 1.0
+            while page_index not in viewer.page_documents and time.perf_counter() < deadline:
+                app.processEvents()
+                time.sleep(0.001)
+            viewer.current_page = page_index
+            with current.sample():
+                viewer.show_page(page_index)
+    viewer.close()
+
+
+def bench_startup(stages, pdf_path, repeat):
+    # 每次启动一个新的阅读器进程，从启动到它报告第一页画出来为止；峰值内存为本进程的，不含子进程
+    with stage(stages, "startup_first_paint", "launches") as current:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            process = subprocess.Popen([sys.executable, MAIN_PATH, pdf_path, "--model", "fake-model",
+                                        "--exit-after-first-paint"], stdout=subprocess.PIPE, text=True)
+            try:
+                for line in process.stdout:
+                    if line.startswith("first paint:"):
+                        current.samples_ms.append((time.perf_counter() - start) * 1000)
+                        current.work += 1
+                        break
+                process.wait(STARTUP_TIMEOUT)
+            finally:
+                if process.poll() is None:
+                    process.kill()
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(RESULTS_DIR)).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def compare(results, baseline_path, threshold=REGRESSION_THRESHOLD):
+    with open(baseline_path, "r") as f:
+        baseline = json.load(f)
+    print(f"\ncompared with {baseline['label']} ({baseline['revision']}):")
+    print(f"{'stage':>22} {'p50 ms':>16} {'throughput':>18}")
+    regressions = []
+    for name, result in results["stages"].items():
+        base = baseline["stages"].get(name)
+        if base is None:
+            continue
+        p50_change = result["p50_ms"] / base["p50_ms"] - 1 if base["p50_ms"] else 0.0
+        throughput_change = result["throughput"] / base["throughput"] - 1 if base["throughput"] else 0.0
+        flag = ""
+        if p50_change > threshold or throughput_change < -threshold:
+            flag = "  REGRESSION"
+            regressions.append(name)
+        print(f"{name:>22} {result['p50_ms']:>8.2f} ({p50_change:>+6.1%}) "
+              f"{result['throughput']:>9.1f} ({throughput_change:>+6.1%}){flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="离线基准测试：PDF 抽取、JSON 加载、LLM 往返、翻页渲染")
+    parser.add_argument("--label", default=None, help="结果文件名，默认为当前 git 版本号")
+    parser.add_argument("--pages", type=int, default=60)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--paragraphs", type=int, default=32)
+    parser.add_argument("--render-pages", type=int, default=30)
+    parser.add_argument("--latency", type=float, default=0.02)
+    parser.add_argument("--token-rate", type=float, default=400.0)
+    parser.add_argument("--skip", nargs="*", default=[], choices=["extraction", "load", "llm", "show_page", "startup"])
+    parser.add_argument("--compare", default=None, help="基线结果文件，对比后有退化时以非零状态退出")
+    args = parser.parse_args()
+
+    revision = git_revision()
+    label = args.label or revision
+    stages = {}
+    original_directory = os.getcwd()
+    with tempfile.TemporaryDirectory() as directory, \
+            FakeOllamaServer(latency=args.latency, token_rate=args.token_rate) as fake_server:
+        # 阅读器的缓存文件都写在当前目录下，放进临时目录，不影响真实数据
+        os.chdir(directory)
+        os.environ["OLLAMA_HOST"] = fake_server.url
+        os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+        try:
+            # main.py 在导入时就创建字体，需要先有 QApplication
+            from PyQt6.QtWidgets import QApplication
+            app = QApplication.instance() or QApplication([])
+            from documents import DocumentRegistry
+            from llm import LanguageProcessor
+            pdf_path = make_pdf(os.path.join(directory, "synthetic.pdf"), pages=args.pages)
+            document = DocumentRegistry().register(pdf_path)
+            document_text = None
+            if "extraction" not in args.skip:
+                document_text = bench_extraction(stages, document, args.repeat)
+            if "load" not in args.skip:
+                if document_text is None:
+                    from document_text import DocumentText
+                    document_text = DocumentText(document)
+                bench_load(stages, document_text, directory, args.repeat)
+            if document_text is not None:
+                document_text.close()
+            if "llm" not in args.skip:
+                from page_store import PageStore, PageColumn
+                store = PageStore(document.page_store_path)
+                paragraphs = [paragraph for page in PageColumn(store, "english") for paragraph in page]
+                store.close()
+                language_unit = LanguageProcessor("fake-model", response_cache_path=None, translation_memory_path=None)
+                bench_llm(stages, language_unit, paragraphs[:args.paragraphs])
+            if "show_page" not in args.skip:
+                bench_show_page(stages, pdf_path, args.render_pages)
+            if "startup" not in args.skip:
+                bench_startup(stages, pdf_path, args.repeat)
+        finally:
+            os.chdir(original_directory)
+
+    results = {"label": label, "revision": revision, "created_at": datetime.now(timezone.utc).isoformat(),
+               "python": sys.version.split()[0], "args": vars(args),
+               "stages": {name: current.summary() for name, current in stages.items()}}
+    print(f"{'stage':>22} {'count':>6} {'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9} {'throughput':>22} {'peak RSS MiB':>12}")
+    for name, result in results["stages"].items():
+        print(f"{name:>22} {result['count']:>6} {result['p50_ms']:>9.2f} {result['p90_ms']:>9.2f} "
+              f"{result['p99_ms']:>9.2f} {result['throughput']:>9.1f} {result['unit']:<12} {result['peak_rss_mb']:>12.1f}")
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    results_path = os.path.join(RESULTS_DIR, f"{label}.json")
+    with open(results_path, "w") as f:
+        json.dump(results, f, indent=1)
+    print(f"saved {results_path}")
+    if args.compare and compare(results, args.compare):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+import argparse
+import random
+
+import fitz  # PyMuPDF
+
+WORDS = ("the wave of technology will change how nations govern people build machines learn intelligence "
+         "containment proliferation power incentives biology software model network data energy future risk "
+         "society history progress regulation openness security compute research labs markets").split()
+
+
+def sentence(rng):
+    words = [rng.choice(WORDS) for _ in range(rng.randint(8, 20))]
+    return " ".join(words).capitalize() + "."
+
+
+def paragraph(rng):
+    return " ".join(sentence(rng) for _ in range(rng.randint(2, 5)))
+
+
+def make_pdf(path, pages=50, paragraphs_per_page=4, chapter_every=10, seed=0):
+    # 生成内容确定的测试 PDF：每页若干段英文，每 chapter_every 页一个一级目录条目。
+    # 每页最后一段有一半概率不以句号结尾，模拟跨页的段落。
+    rng = random.Random(seed)
+    doc = fitz.open()
+    toc = []
+    for page_index in range(pages):
+        page = doc.new_page()
+        if page_index % chapter_every == 0:
+            toc.append([1, f"Chapter {page_index // chapter_every + 1}", page_index + 1])
+        y = 72
+        for paragraph_index in range(paragraphs_per_page):
+            text = paragraph(rng)
+            if paragraph_index == paragraphs_per_page - 1 and rng.random() < 0.5:
+                text = text[:-1] + " and"
+            rect = fitz.Rect(72, y, page.rect.width - 72, y + 160)
+            page.insert_textbox(rect, text, fontsize=10)
+            y += 170
+    doc.set_toc(toc)
+    doc.set_metadata({"title": "Synthetic Book", "author": "Benchmark"})
+    doc.save(path)
+    doc.close()
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="生成用于基准测试的 PDF")
+    parser.add_argument("path", nargs="?", default="synthetic.pdf")
+    parser.add_argument("--pages", type=int, default=50)
+    parser.add_argument("--paragraphs-per-page", type=int, default=4)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    make_pdf(args.path, pages=args.pages, paragraphs_per_page=args.paragraphs_per_page, seed=args.seed)
+    print(f"wrote {args.pages} pages to {args.path}")
+
+
+if __name__ == "__main__":
+    main()
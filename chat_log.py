@@ -0,0 +1,59 @@
+import sqlite3
+import threading
+import time
+
+# 每次从磁盘读取的消息条数：启动时读最后一页，往上翻到顶时再读前一页
+CHAT_PAGE_SIZE = 50
+
+
+class ChatLog:
+    # 一本书的对话记录，存放在它缓存目录下的 SQLite 中，每条消息（提问、回复、状态提示）一行。
+    # 每次启动是一个新的会话，会话中第一次写入时先写一条带时间的会话标记。
+    # 只追加、按 id 倒序分页读取，记录再长，打开和追加的开销也不变。
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        with self.connection:
+            self.connection.execute("CREATE TABLE IF NOT EXISTS messages (id INTEGER PRIMARY KEY, session INTEGER "
+                                    "NOT NULL, role TEXT NOT NULL, text TEXT NOT NULL, created REAL NOT NULL)")
+        row = self.connection.execute("SELECT MAX(session) FROM messages").fetchone()
+        self.session = (row[0] or 0) + 1
+        self.session_started = False
+
+    def insert(self, role, text):
+        cursor = self.connection.execute("INSERT INTO messages (session, role, text, created) VALUES (?, ?, ?, ?)",
+                                         (self.session, role, text, time.time()))
+        return cursor.lastrowid
+
+    def append(self, role, text):
+        # 返回 [(id, role, text)]：新写入的消息，会话的第一条消息前面还有会话标记
+        written = []
+        with self.lock:
+            with self.connection:
+                if not self.session_started:
+                    self.session_started = True
+                    marker = time.strftime("%Y-%m-%d %H:%M")
+                    written.append((self.insert("session", marker), "session", marker))
+                written.append((self.insert(role, text), role, text))
+        return written
+
+    def update(self, message_id, text):
+        # 流式回复在结束（完成、停止或失败）时写入最终文本
+        with self.lock:
+            with self.connection:
+                self.connection.execute("UPDATE messages SET text = ? WHERE id = ?", (text, message_id))
+
+    def messages(self, before_id=None, limit=CHAT_PAGE_SIZE):
+        # id 小于 before_id 的最后 limit 条消息，按时间顺序返回 [(id, role, text)]
+        with self.lock:
+            rows = self.connection.execute("SELECT id, role, text FROM messages WHERE id < ? ORDER BY id DESC "
+                                           "LIMIT ?", (before_id if before_id is not None else 2 ** 63 - 1,
+                                                       limit)).fetchall()
+        return rows[::-1]
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
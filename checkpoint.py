@@ -0,0 +1,72 @@
+import hashlib
+import json
+import os
+import threading
+
+
+def text_hash(text):
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+def page_hash(paragraph_list):
+    return text_hash("\n".join(paragraph_list))
+
+
+class PreprocessJournal:
+    # 追加写入的预处理日志：每完成一条翻译或总结就立即落盘，重启后跳过已完成的工作。
+    # 记录以内容哈希为键，PDF 文本变化后只有内容变了的段落/页面需要重做。
+    def __init__(self, path):
+        self.path = path
+        self.translations = {}
+        self.summaries = {}
+        if os.path.exists(path):
+            self.replay()
+        self.file = open(path, "a", encoding="utf-8")
+        # 并发预处理时多个工作线程会同时写日志
+        self.lock = threading.Lock()
+
+    def replay(self):
+        with open(self.path, "rb") as f:
+            data = f.read()
+        # 进程崩溃时最后一行可能只写了一半，截掉它，避免后续追加的记录与之粘连
+        end = data.rfind(b"\n") + 1
+        if end < len(data):
+            with open(self.path, "r+b") as f:
+                f.truncate(end)
+        for line in data[:end].decode("utf-8").splitlines():
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if record["type"] == "translation":
+                self.translations[record["hash"]] = record["text"]
+            elif record["type"] == "summary":
+                self.summaries[(record["hash"], record["length"])] = record["text"]
+
+    def append(self, record):
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        with self.lock:
+            self.file.write(line)
+            self.file.flush()
+            os.fsync(self.file.fileno())
+
+    def get_translation(self, paragraph):
+        return self.translations.get(text_hash(paragraph))
+
+    def add_translation(self, paragraph, translation):
+        key = text_hash(paragraph)
+        self.translations[key] = translation
+        self.append({"type": "translation", "hash": key, "text": translation})
+
+    def get_summary(self, paragraph_list, summary_length):
+        return self.summaries.get((page_hash(paragraph_list), summary_length))
+
+    def add_summary(self, paragraph_list, summary_length, summary):
+        key = page_hash(paragraph_list)
+        self.summaries[(key, summary_length)] = summary
+        self.append({"type": "summary", "hash": key, "length": summary_length, "text": summary})
+
+    def close(self):
+        self.file.close()
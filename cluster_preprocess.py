@@ -0,0 +1,260 @@
+import argparse
+import threading
+import time
+import urllib.request
+from collections import deque
+
+from checkpoint import PreprocessJournal
+from document_text import DocumentText, PACKED_TRANSLATION, TRANSLATION_BATCH_TOKENS, TRANSLATION_BATCH_SEGMENTS
+from documents import DocumentRegistry
+from llm import LanguageProcessor, MODEL_CARDS
+from model_selection import ModelSelector, calibrate
+from tracing import traced, annotate, count
+from translation_memory import format_stats
+from utils import pack_paragraphs
+
+DEFAULT_HOSTS = ["http://127.0.0.1:11434"]
+# 每个节点同时处理的页数，建议与该节点的 OLLAMA_NUM_PARALLEL 一致
+ENDPOINT_CONCURRENCY = 2
+HEALTH_CHECK_TIMEOUT = 5.0
+# 同一页在仍然健康的节点上失败这么多次后放弃，留给下次运行
+MAX_PAGE_ATTEMPTS = 3
+
+
+def normalize_host(host):
+    return host if "://" in host else "http://" + host
+
+
+class Endpoint:
+    # 一个 Ollama 节点：自己的客户端、分到的页（从头部取，空闲的节点从尾部分走），以及实测的速度
+    def __init__(self, host, model_name):
+        self.host = normalize_host(host)
+        self.language_unit = LanguageProcessor(model_name, host=self.host, response_cache_path=None)
+        self.alive = False
+        self.tokens_per_second = 0.0
+        self.pages = deque()
+        self.pages_done = 0
+        self.busy_seconds = 0.0
+
+    def reachable(self):
+        try:
+            with urllib.request.urlopen(self.host + "/api/version", timeout=HEALTH_CHECK_TIMEOUT):
+                return True
+        except OSError:
+            return False
+
+    def check(self):
+        # 健康检查：服务可达、模型在本地（没有则 pull），并用一次校准请求测出生成速度
+        if not self.reachable():
+            return False
+        llm = self.language_unit.llm
+        try:
+            llm.pull()
+            self.tokens_per_second = calibrate(llm.client, llm.model_name)["tokens_per_second"]
+        except Exception as e:
+            print(f"{self.host} 不可用：{e}")
+            return False
+        self.language_unit.model_ready.set()
+        self.alive = True
+        return True
+
+    def pages_per_second(self):
+        return self.pages_done / self.busy_seconds if self.busy_seconds else 0.0
+
+
+class ClusterPreprocessor:
+    # 把一本书的预处理分到多个 Ollama 节点上：
+    # - 开始前并行做健康检查，按校准测得的生成速度把待处理的页切成连续的分片
+    # - 每个节点 concurrency 个线程从自己的分片里取页；分片做完后，从剩余页最多的节点尾部分走一部分，
+    #   分走的比例按两者实测的每秒页数计算，两边大致同时完成
+    # - 请求失败时重新检查该节点，节点不可达则把它剩下的页和失败的页交给其他节点
+    # - 结果都写入同一个页面存储和预处理日志，中断后重新运行只处理没做完的页
+    def __init__(self, document_text, hosts, model_name, concurrency=ENDPOINT_CONCURRENCY, packed=PACKED_TRANSLATION):
+        self.document_text = document_text
+        self.endpoints = [Endpoint(host, model_name) for host in hosts]
+        self.concurrency = concurrency
+        self.packed = packed
+        self.condition = threading.Condition()
+        # 失败后待重新分配的页，任何节点都优先处理
+        self.orphans = deque()
+        self.in_flight = 0
+        self.attempts = {}
+        self.failed_pages = []
+
+    def pending_pages(self):
+        document_text = self.document_text
+        pages = []
+        for page_index in range(document_text.document.last_page + 1):
+            english = document_text.paragraphs[page_index]
+            if english and (len(document_text.translated_paragraphs[page_index]) < len(english)
+                            or not document_text.page_summary_200[page_index]):
+                pages.append(page_index)
+        return pages
+
+    def shard(self, pages, endpoints):
+        total_speed = sum(endpoint.tokens_per_second for endpoint in endpoints)
+        start = 0
+        for index, endpoint in enumerate(endpoints):
+            if index == len(endpoints) - 1:
+                end = len(pages)
+            elif total_speed:
+                end = start + round(len(pages) * endpoint.tokens_per_second / total_speed)
+            else:
+                end = start + len(pages) // len(endpoints)
+            endpoint.pages.extend(pages[start:end])
+            start = end
+
+    def share(self, endpoint, victim):
+        # endpoint 应从 victim 剩下的页中分走的比例；两者都处理过页时用实测的每秒页数，否则用校准的生成速度
+        if endpoint.pages_done and victim.pages_done:
+            mine, theirs = endpoint.pages_per_second(), victim.pages_per_second()
+        else:
+            mine, theirs = endpoint.tokens_per_second, victim.tokens_per_second
+        return mine / (mine + theirs) if mine + theirs else 0.5
+
+    def steal(self, endpoint):
+        victims = [victim for victim in self.endpoints if victim is not endpoint and victim.pages]
+        if not victims:
+            return
+        victim = max(victims, key=lambda item: len(item.pages))
+        taken = max(1, int(len(victim.pages) * self.share(endpoint, victim)))
+        stolen = [victim.pages.pop() for _ in range(taken)]
+        endpoint.pages.extend(reversed(stolen))
+
+    def next_page(self, endpoint):
+        # 没有可取的页但还有页在别的节点上处理时等待，那些页失败后可能还要重新分配
+        with self.condition:
+            while endpoint.alive:
+                if self.orphans:
+                    page_index = self.orphans.popleft()
+                else:
+                    if not endpoint.pages:
+                        self.steal(endpoint)
+                    page_index = endpoint.pages.popleft() if endpoint.pages else None
+                if page_index is not None:
+                    self.in_flight += 1
+                    return page_index
+                if self.in_flight == 0:
+                    return None
+                self.condition.wait()
+            return None
+
+    @traced("cluster.page")
+    def process_page(self, endpoint, journal, page_index):
+        annotate(host=endpoint.host, page_index=page_index)
+        document_text = self.document_text
+        language_unit = endpoint.language_unit
+        paragraph_list = document_text.paragraphs[page_index]
+        if self.packed:
+            batches = pack_paragraphs(paragraph_list, TRANSLATION_BATCH_TOKENS, TRANSLATION_BATCH_SEGMENTS)
+        else:
+            batches = [[paragraph_english] for paragraph_english in paragraph_list]
+        chinese = [paragraph_chinese for batch in batches
+                   for paragraph_chinese in DocumentText.translate_batch(language_unit, journal, batch)]
+        summaries = document_text.summarize_page(language_unit, journal, page_index)
+        document_text.store.update_page(page_index, chinese=chinese, summary_100=summaries[100],
+                                        summary_200=summaries[200], summary_300=summaries[300])
+
+    def on_failure(self, endpoint, page_index, error):
+        alive = endpoint.reachable()
+        with self.condition:
+            self.in_flight -= 1
+            self.attempts[page_index] = self.attempts.get(page_index, 0) + 1
+            if not alive and endpoint.alive:
+                endpoint.alive = False
+                print(f"{endpoint.host} 已断开，{len(endpoint.pages) + 1} 页交给其他节点")
+                count("cluster.endpoint_failures")
+                self.orphans.extend(endpoint.pages)
+                endpoint.pages.clear()
+            if alive and self.attempts[page_index] >= MAX_PAGE_ATTEMPTS:
+                print(f"第 {page_index + 1} 页处理失败：{error}")
+                self.failed_pages.append(page_index)
+            else:
+                self.orphans.append(page_index)
+            self.condition.notify_all()
+
+    def work(self, endpoint, journal):
+        while True:
+            page_index = self.next_page(endpoint)
+            if page_index is None:
+                return
+            start = time.perf_counter()
+            try:
+                self.process_page(endpoint, journal, page_index)
+            except Exception as e:
+                self.on_failure(endpoint, page_index, e)
+                continue
+            with self.condition:
+                self.in_flight -= 1
+                endpoint.pages_done += 1
+                # 同一节点的多个线程并行处理，忙碌时间按并发数折算
+                endpoint.busy_seconds += (time.perf_counter() - start) / self.concurrency
+                self.condition.notify_all()
+
+    @traced("cluster.preprocess")
+    def run(self):
+        checks = [threading.Thread(target=endpoint.check) for endpoint in self.endpoints]
+        for thread in checks:
+            thread.start()
+        for thread in checks:
+            thread.join()
+        alive = [endpoint for endpoint in self.endpoints if endpoint.alive]
+        if not alive:
+            raise RuntimeError("没有可用的 Ollama 节点")
+        pages = self.pending_pages()
+        annotate(pages=len(pages), endpoints=len(alive))
+        self.shard(pages, alive)
+        journal = PreprocessJournal(self.document_text.document.journal_path)
+        try:
+            workers = [threading.Thread(target=self.work, args=(endpoint, journal))
+                       for endpoint in alive for _ in range(self.concurrency)]
+            for thread in workers:
+                thread.start()
+            for thread in workers:
+                thread.join()
+        finally:
+            journal.close()
+        # 所有节点都断开时剩下的页留给下次运行
+        self.failed_pages += list(self.orphans) + [page_index for endpoint in self.endpoints
+                                                   for page_index in endpoint.pages]
+        self.document_text.save()
+        return sorted(self.failed_pages)
+
+    def report(self):
+        lines = [f"{'host':>28} {'alive':>6} {'pages':>6} {'pages/s':>8} {'tok/s':>8} {'output tok':>10}"]
+        for endpoint in self.endpoints:
+            completion_tokens = sum(item["completion_tokens"] for item in endpoint.language_unit.llm.call_stats)
+            lines.append(f"{endpoint.host:>28} {str(endpoint.alive):>6} {endpoint.pages_done:>6} "
+                         f"{endpoint.pages_per_second():>8.2f} {endpoint.tokens_per_second:>8.1f} "
+                         f"{completion_tokens:>10}")
+        memories = [endpoint.language_unit.translation_memory for endpoint in self.endpoints
+                    if endpoint.language_unit.translation_memory is not None]
+        if memories:
+            lines.append(format_stats(memories))
+        return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="在多个 Ollama 节点上分片预处理一本书（翻译与每页总结）")
+    parser.add_argument("pdf_path")
+    parser.add_argument("--hosts", nargs="+", default=DEFAULT_HOSTS, help="Ollama 服务地址，如 http://gpu1:11434")
+    parser.add_argument("--model", default=None, help="默认在第一个节点上按生成速度选择")
+    parser.add_argument("--concurrency", type=int, default=ENDPOINT_CONCURRENCY, help="每个节点同时处理的页数")
+    args = parser.parse_args()
+
+    model_name = args.model or ModelSelector(MODEL_CARDS, host=normalize_host(args.hosts[0])).batch_model()
+    document = DocumentRegistry().register(args.pdf_path)
+    document_text = DocumentText(document)
+    try:
+        cluster = ClusterPreprocessor(document_text, args.hosts, model_name, concurrency=args.concurrency)
+        start = time.perf_counter()
+        failed_pages = cluster.run()
+        print(cluster.report())
+        print(f"{time.perf_counter() - start:.1f} 秒，未完成 {len(failed_pages)} 页"
+              + (f"：{[page_index + 1 for page_index in failed_pages]}" if failed_pages else ""))
+    finally:
+        document_text.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+import numpy as np
+
+from retrieval import tokenize
+from tracing import traced, annotate
+from utils import estimate_tokens, split_sentences
+
+# 无论相关度如何都保留的句子（全文中的序号），默认保留第一句，让模型知道这段文字从哪里开始
+ANCHOR_SENTENCES = (0,)
+
+
+def tfidf_vectors(token_lists, query_tokens=None):
+    # 每句一行的 TF-IDF 矩阵（次线性 tf，平滑 idf），按行 L2 归一化；同时返回查询在同一词表下的向量
+    vocabulary = {}
+    rows, columns = [], []
+    for row, tokens in enumerate(token_lists):
+        for token in tokens:
+            rows.append(row)
+            columns.append(vocabulary.setdefault(token, len(vocabulary)))
+    counts = np.zeros((len(token_lists), len(vocabulary)), dtype=np.float32)
+    np.add.at(counts, (np.asarray(rows, dtype=np.int64), np.asarray(columns, dtype=np.int64)), 1.0)
+    document_frequency = (counts > 0).sum(axis=0)
+    idf = np.log((1 + len(token_lists)) / (1 + document_frequency)).astype(np.float32) + 1
+    matrix = np.where(counts > 0, 1 + np.log(np.maximum(counts, 1)), 0) * idf
+    matrix /= np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+    query = np.zeros(len(vocabulary), dtype=np.float32)
+    for token in query_tokens or ():
+        column = vocabulary.get(token)
+        if column is not None:
+            query[column] += 1.0
+    query = np.where(query > 0, 1 + np.log(np.maximum(query, 1)), 0) * idf
+    return matrix, query
+
+
+@traced("context.compress")
+def compress(paragraphs, token_budget, query=None, anchors=ANCHOR_SENTENCES):
+    # 抽取式压缩：把段落拆成句子，按与 query 的 TF-IDF 余弦相似度排序（没有 query 或与全文没有共同词时，
+    # 按与全文质心的相似度），先放 anchors，再按得分从高到低放入 token_budget，最后按原文顺序拼回。
+    # 返回与 paragraphs 一一对应的列表，一句都没留下的段落为空字符串。
+    # 只有真正做了压缩的调用才记录压缩前后的 token 数，统计面板中的压缩比不会被没超预算的调用拉高。
+    original_tokens = sum(estimate_tokens(paragraph) + 1 for paragraph in paragraphs)
+    if original_tokens <= token_budget:
+        return list(paragraphs)
+    sentences = []
+    owners = []
+    for paragraph_index, paragraph in enumerate(paragraphs):
+        for sentence in split_sentences(paragraph):
+            sentences.append(sentence)
+            owners.append(paragraph_index)
+    if not sentences:
+        return ["" for _ in paragraphs]
+    matrix, query_vector = tfidf_vectors([tokenize(sentence) for sentence in sentences],
+                                         tokenize(query) if query else None)
+    if not query_vector.any():
+        query_vector = matrix.mean(axis=0)
+    scores = matrix @ (query_vector / max(float(np.linalg.norm(query_vector)), 1e-12))
+    order = [index for index in anchors if -len(sentences) <= index < len(sentences)]
+    order = [index % len(sentences) for index in order] + np.argsort(-scores, kind="stable").tolist()
+    kept = set()
+    budget = token_budget
+    for index in order:
+        cost = estimate_tokens(sentences[index]) + 1
+        if index not in kept and cost <= budget:
+            kept.add(index)
+            budget -= cost
+    compressed = [[] for _ in paragraphs]
+    for index in sorted(kept):
+        compressed[owners[index]].append(sentences[index])
+    annotate(original_tokens=original_tokens, compressed_tokens=token_budget - budget, sentences=len(sentences),
+             kept_sentences=len(kept))
+    return [" ".join(paragraph_sentences) for paragraph_sentences in compressed]
@@ -0,0 +1,141 @@
+import os
+
+from checkpoint import PreprocessJournal
+from extraction import extract_page_blocks
+from llm import SUMMARY_LENGTHS
+from page_store import PageStore, PageColumn, migrate_json, export_json
+from scheduler import LLMScheduler
+from tracing import traced
+from translation_memory import format_stats
+from utils import pack_paragraphs
+
+PREPROCESS_CONCURRENCY = 4
+# 打包翻译：每批最多的估算 token 数与段数
+PACKED_TRANSLATION = True
+TRANSLATION_BATCH_TOKENS = 600
+TRANSLATION_BATCH_SEGMENTS = 8
+
+
+class DocumentText:
+    def __init__(self, document, seed_text_path=None):
+        # 文本按页存放在该文档自己缓存目录下的 SQLite 中，打开时不加载任何页面，show_page 用到哪页才读哪页。
+        # 缓存为空时依次尝试：该文档导出的 JSON、seed_text_path（随项目分发的预处理结果）、从 PDF 抽取
+        self.document = document
+        self.store = PageStore(document.page_store_path)
+        if self.store.page_count() == 0:
+            if os.path.exists(document.processed_text_path):
+                self.load(document.processed_text_path)
+            elif seed_text_path is not None and os.path.exists(seed_text_path):
+                self.load(seed_text_path)
+            else:
+                self.setup()
+        self.paragraphs = PageColumn(self.store, "english")
+        self.translated_paragraphs = PageColumn(self.store, "chinese")
+        self.page_summary_100 = PageColumn(self.store, "summary_100")
+        self.page_summary_200 = PageColumn(self.store, "summary_200")
+        self.page_summary_300 = PageColumn(self.store, "summary_300")
+
+    def is_empty_page(self, page_index):
+        return len(self.paragraphs[page_index]) == 0
+
+    @traced("document.setup")
+    def setup(self):
+        # 各页文本块由多个进程并行抽取，段落跨页的拼接在这里按页序串行完成
+        first_page, last_page = self.document.first_page, self.document.last_page
+        page_indices = range(first_page, last_page + 1)
+        page_blocks = extract_page_blocks(self.document.path, page_indices)
+        paragraphs = [[] for _ in range(last_page + 1)]
+        paragraph = ""
+        for page_index, blocks in zip(page_indices, page_blocks):
+            for block in blocks:
+                block_text = block.replace("\n", " ").strip(" ")
+                if paragraph == "":
+                    paragraph = block_text
+                else:
+                    paragraph += " " + block_text
+
+                if not paragraph.endswith("."):
+                    continue
+
+                paragraphs[page_index].append(paragraph)
+                paragraph = ""
+        self.store.write_pages({page_index: {"english": paragraphs[page_index]} for page_index in range(last_page + 1)})
+
+    @traced("document.preprocess")
+    def preprocess(self, language_unit, concurrency=PREPROCESS_CONCURRENCY, packed=PACKED_TRANSLATION):
+        # 每条结果完成后立即写入日志，中途崩溃重启时只处理尚未完成或内容有变化的部分。
+        # 请求经调度器并发发出，结果按提交顺序写回，输出与串行处理完全一致。
+        # packed 为真时，同一页相邻的段落按 token 预算打包，编号后在一次请求里翻译。
+        # 出错或被中断时，调度器退出前会等正在执行的请求写完日志，之后才关闭日志。
+        from tqdm import tqdm
+
+        journal = PreprocessJournal(self.document.journal_path)
+        page_count = self.document.last_page + 1
+        try:
+            with LLMScheduler(max_workers=concurrency) as scheduler:
+                translations = [[] for _ in range(page_count)]
+                summaries = [None for _ in range(page_count)]
+                for page_index in tqdm(range(page_count)):
+                    paragraph_list = self.paragraphs[page_index]
+                    if packed:
+                        batches = pack_paragraphs(paragraph_list, TRANSLATION_BATCH_TOKENS, TRANSLATION_BATCH_SEGMENTS)
+                    else:
+                        batches = [[paragraph_english] for paragraph_english in paragraph_list]
+                    for batch in batches:
+                        translations[page_index].append(
+                            scheduler.submit(self.translate_batch, language_unit, journal, batch))
+                    if len(self.paragraphs[page_index]) > 0:
+                        summaries[page_index] = scheduler.submit(self.summarize_page, language_unit, journal,
+                                                                 page_index)
+                for page_index in range(page_count):
+                    # 一页的译文和总结在同一个事务里写入
+                    values = {"chinese": [paragraph_chinese for future in translations[page_index]
+                                          for paragraph_chinese in future.result()]}
+                    if summaries[page_index] is not None:
+                        page_summaries = summaries[page_index].result()
+                        values["summary_100"] = page_summaries[100]
+                        values["summary_200"] = page_summaries[200]
+                        values["summary_300"] = page_summaries[300]
+                    self.store.update_page(page_index, **values)
+        finally:
+            journal.close()
+        self.save()
+        if language_unit.translation_memory is not None:
+            print(format_stats([language_unit.translation_memory]))
+
+    @staticmethod
+    def translate_paragraph(language_unit, journal, paragraph_english):
+        paragraph_chinese = journal.get_translation(paragraph_english)
+        if paragraph_chinese is None:
+            paragraph_chinese = language_unit.translate(paragraph_english)
+            journal.add_translation(paragraph_english, paragraph_chinese)
+        return paragraph_chinese
+
+    @staticmethod
+    def translate_batch(language_unit, journal, paragraph_list):
+        missing = list(dict.fromkeys(paragraph for paragraph in paragraph_list
+                                     if journal.get_translation(paragraph) is None))
+        if missing:
+            for paragraph_english, paragraph_chinese in zip(missing, language_unit.translate_batch(missing)):
+                journal.add_translation(paragraph_english, paragraph_chinese)
+        return [journal.get_translation(paragraph) for paragraph in paragraph_list]
+
+    def summarize_page(self, language_unit, journal, page_index):
+        paragraph_list = self.paragraphs[page_index]
+        summaries = {length: journal.get_summary(paragraph_list, length) for length in SUMMARY_LENGTHS}
+        if None in summaries.values():
+            summaries = language_unit.summarize_all(paragraph_list)
+            for summary_length, summary in summaries.items():
+                journal.add_summary(paragraph_list, summary_length, summary)
+        return summaries
+
+    def save(self):
+        # 导出为便于分发的 processed_texts.json；阅读器本身只读写 processed_texts.db
+        export_json(self.store, self.document.processed_text_path)
+
+    @traced("document.load")
+    def load(self, json_path):
+        migrate_json(json_path, self.store)
+
+    def close(self):
+        self.store.close()
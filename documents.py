@@ -0,0 +1,119 @@
+import hashlib
+import json
+import os
+
+DOCUMENTS_DIR = "documents"
+REGISTRY_FILE = "registry.json"
+HASH_CHUNK_SIZE = 1 << 20
+
+
+def file_hash(path):
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+class Document:
+    # 一本书的元信息和它专属的缓存目录。页码都是从 0 开始的页下标。
+    def __init__(self, key, path, cache_dir, title, author, first_page, last_page, chapters):
+        self.key = key
+        self.path = path
+        self.cache_dir = cache_dir
+        self.title = title
+        self.author = author
+        self.first_page = first_page
+        self.last_page = last_page
+        # [(章节标题, 起始页下标)]
+        self.chapters = chapters
+
+    @property
+    def page_store_path(self):
+        return os.path.join(self.cache_dir, "processed_texts.db")
+
+    @property
+    def processed_text_path(self):
+        return os.path.join(self.cache_dir, "processed_texts.json")
+
+    @property
+    def journal_path(self):
+        return os.path.join(self.cache_dir, "preprocess_journal.jsonl")
+
+    @property
+    def chat_log_path(self):
+        return os.path.join(self.cache_dir, "chat_log.db")
+
+    @property
+    def embedding_cache_dir(self):
+        return os.path.join(self.cache_dir, "embedding_cache")
+
+
+def read_layout(pdf_path):
+    # 从 PDF 的元数据和目录（doc.get_toc()）推断书名、正文页范围和章节：
+    # 正文从目录中第一个一级条目开始，到最后一页结束；没有目录时取整本书。
+    import fitz  # PyMuPDF
+
+    doc = fitz.open(pdf_path)
+    try:
+        metadata = doc.metadata or {}
+        title = metadata.get("title") or os.path.splitext(os.path.basename(pdf_path))[0]
+        author = metadata.get("author") or ""
+        chapters = [(entry_title.strip(), page - 1) for level, entry_title, page, *_ in doc.get_toc(simple=True)
+                    if level == 1 and 1 <= page <= doc.page_count and entry_title.strip()]
+        first_page = min((page_index for _, page_index in chapters), default=0)
+        return {"title": title, "author": author, "first_page": first_page, "last_page": doc.page_count - 1,
+                "chapters": chapters}
+    finally:
+        doc.close()
+
+
+class DocumentRegistry:
+    # 已打开过的 PDF 的登记表：以文件内容的哈希为键，每本书一个缓存目录 documents/<哈希前缀>/，
+    # 放它自己的 processed_texts.db、预处理日志和 embedding 缓存。文件改名或移动后仍能找回缓存，
+    # 内容变了则视为一本新书。推断出的页范围和章节写在 registry.json 里，可以手工修改。
+    def __init__(self, root=DOCUMENTS_DIR):
+        self.root = root
+        self.registry_path = os.path.join(root, REGISTRY_FILE)
+        self.entries = {}
+        os.makedirs(root, exist_ok=True)
+        if os.path.exists(self.registry_path):
+            with open(self.registry_path, "r", encoding="utf-8") as f:
+                self.entries = json.load(f)
+
+    def save(self):
+        temporary_path = self.registry_path + ".tmp"
+        with open(temporary_path, "w", encoding="utf-8") as f:
+            json.dump(self.entries, f, ensure_ascii=False, indent=1)
+        os.replace(temporary_path, self.registry_path)
+
+    def document(self, key):
+        entry = self.entries[key]
+        return Document(key, entry["path"], os.path.join(self.root, key[:16]), entry["title"], entry["author"],
+                        entry["first_page"], entry["last_page"], [tuple(chapter) for chapter in entry["chapters"]])
+
+    def documents(self):
+        return [self.document(key) for key in self.entries]
+
+    def find(self, path, stat):
+        # 路径、大小和修改时间都没变的文件直接沿用登记过的哈希，启动时不必重读整个 PDF
+        for key, entry in self.entries.items():
+            if entry["path"] == path and entry.get("size") == stat.st_size and entry.get("mtime") == stat.st_mtime:
+                return key
+        return None
+
+    def register(self, pdf_path, **overrides):
+        # overrides（title/author/first_page/last_page/chapters）只在第一次登记时覆盖从 PDF 推断的值
+        path = os.path.abspath(pdf_path)
+        stat = os.stat(path)
+        key = self.find(path, stat)
+        if key is None:
+            key = file_hash(pdf_path)
+            if key not in self.entries:
+                self.entries[key] = read_layout(pdf_path)
+                self.entries[key].update(overrides)
+            self.entries[key].update(path=path, size=stat.st_size, mtime=stat.st_mtime)
+            self.save()
+        document = self.document(key)
+        os.makedirs(document.cache_dir, exist_ok=True)
+        return document
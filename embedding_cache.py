@@ -0,0 +1,100 @@
+import json
+import os
+
+import numpy as np
+
+from checkpoint import text_hash
+
+
+class EmbeddingCache:
+    # 磁盘上的 embedding 缓存：
+    # - embeddings.npy：float32 矩阵，按行存放向量，启动时以内存映射方式打开，不拷贝数据
+    # - index.json：模型名、向量维度、已用行数，以及 段落哈希 -> 行号
+    # 矩阵按容量翻倍预留空行，新增向量直接写进空行；换了 embedding 模型时整个缓存作废重建。
+    def __init__(self, directory, model_name, initial_capacity=1024):
+        self.directory = directory
+        self.model_name = model_name
+        self.initial_capacity = initial_capacity
+        self.matrix_path = os.path.join(directory, "embeddings.npy")
+        self.index_path = os.path.join(directory, "index.json")
+        self.rows = {}
+        self.count = 0
+        self.matrix = None
+        os.makedirs(directory, exist_ok=True)
+        self.load()
+
+    def load(self):
+        if not (os.path.exists(self.index_path) and os.path.exists(self.matrix_path)):
+            return
+        with open(self.index_path, "r") as f:
+            index = json.load(f)
+        if index.get("model") != self.model_name:
+            print(f"embedding 模型由 {index.get('model')} 变为 {self.model_name}，缓存作废")
+            self.clear()
+            return
+        self.matrix = np.load(self.matrix_path, mmap_mode="r+")
+        self.rows = index["rows"]
+        self.count = index["count"]
+
+    def clear(self):
+        for path in (self.index_path, self.matrix_path):
+            if os.path.exists(path):
+                os.remove(path)
+        self.rows = {}
+        self.count = 0
+        self.matrix = None
+
+    def __len__(self):
+        return self.count
+
+    def __contains__(self, text):
+        return text_hash(text) in self.rows
+
+    def reserve(self, total, dimension):
+        if self.matrix is not None and self.matrix.shape[0] >= total:
+            return
+        capacity = self.initial_capacity if self.matrix is None else self.matrix.shape[0]
+        while capacity < total:
+            capacity *= 2
+        temporary_path = self.matrix_path + ".tmp"
+        matrix = np.lib.format.open_memmap(temporary_path, mode="w+", dtype=np.float32, shape=(capacity, dimension))
+        if self.matrix is not None:
+            matrix[:self.count] = self.matrix[:self.count]
+        matrix.flush()
+        del matrix
+        self.matrix = None
+        os.replace(temporary_path, self.matrix_path)
+        self.matrix = np.load(self.matrix_path, mmap_mode="r+")
+
+    def append(self, texts, vectors):
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(len(texts), -1)
+        if len(texts) == 0:
+            return
+        self.reserve(self.count + len(texts), vectors.shape[1])
+        self.matrix[self.count:self.count + len(texts)] = vectors
+        self.matrix.flush()
+        for offset, text in enumerate(texts):
+            self.rows[text_hash(text)] = self.count + offset
+        self.count += len(texts)
+        self.save_index()
+
+    def save_index(self):
+        # 先写向量再写索引，索引里出现的行一定已经落盘；用替换文件的方式保证索引文件完整
+        temporary_path = self.index_path + ".tmp"
+        with open(temporary_path, "w") as f:
+            json.dump({"model": self.model_name, "count": self.count, "rows": self.rows}, f)
+        os.replace(temporary_path, self.index_path)
+
+    def embed(self, texts, embed_fn, batch_size=64):
+        # 返回 texts 对应的向量矩阵，只有缓存里没有的文本才调用 embed_fn
+        missing = list(dict.fromkeys(text for text in texts if text_hash(text) not in self.rows))
+        for start in range(0, len(missing), batch_size):
+            batch = missing[start:start + batch_size]
+            self.append(batch, embed_fn(batch))
+        rows = np.fromiter((self.rows[text_hash(text)] for text in texts), dtype=np.int64, count=len(texts))
+        if len(rows) and rows[0] == 0 and np.array_equal(rows, np.arange(len(rows))):
+            # 常见情况：同一本书按相同顺序加载，直接返回内存映射上的视图，不拷贝
+            return self.matrix[:len(rows)]
+        if len(rows) == 0:
+            return np.zeros((0, 0 if self.matrix is None else self.matrix.shape[1]), dtype=np.float32)
+        return self.matrix[rows]
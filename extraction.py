@@ -0,0 +1,38 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+# 页数太少时进程池的启动开销比抽取本身还大
+MIN_PAGES_PER_WORKER = 8
+
+worker_document = None
+
+
+def init_worker(pdf_path):
+    # 每个工作进程只打开一次 PDF，之后处理分到的所有页面
+    # PyMuPDF 导入较慢，真正抽取时才导入，不拖慢阅读器启动
+    import fitz  # PyMuPDF
+
+    global worker_document
+    worker_document = fitz.open(pdf_path)
+
+
+def read_page_blocks(page_index):
+    page = worker_document.load_page(page_index)
+    return [block[4] for block in page.get_text("blocks")]
+
+
+def extract_page_blocks(pdf_path, page_indices, workers=None):
+    # 按页分片并行抽取文本块，返回与 page_indices 顺序一致的每页文本块列表。
+    # 段落跨页拼接依赖前一页的状态，必须由调用方在拿到全部结果后串行合并。
+    page_indices = list(page_indices)
+    workers = workers or os.cpu_count() or 1
+    workers = min(workers, max(1, len(page_indices) // MIN_PAGES_PER_WORKER))
+    if workers <= 1:
+        init_worker(pdf_path)
+        try:
+            return [read_page_blocks(page_index) for page_index in page_indices]
+        finally:
+            worker_document.close()
+    chunksize = max(1, len(page_indices) // (workers * 4))
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(pdf_path,)) as pool:
+        return list(pool.map(read_page_blocks, page_indices, chunksize=chunksize))
@@ -11,4 +11,5 @@ pip install screeninfo==0.8.1
 pip install pyqt6==6.8.0
 pip install tqdm==4.67.1
 pip install psutil==6.1.1
-pip install gputil==6.1.1
\ No newline at end of file
+pip install gputil==6.1.1
+pip install numpy==2.2.1
\ No newline at end of file
@@ -0,0 +1,115 @@
+import threading
+
+from checkpoint import PreprocessJournal
+from scheduler import LLMScheduler
+
+# 当前页处理完后，顺着阅读方向预先处理的页数
+WARM_PAGES = 3
+STOP_TIMEOUT = 5.0
+MODEL_WAIT_INTERVAL = 0.2
+
+
+class LazyPreprocessor:
+    # 边读边处理：还没有预处理过的页面在第一次打开时才翻译和总结。
+    # - 后台只有一个工作线程，每次只做一件事（翻译一段或总结一页），给聊天留出 GPU
+    # - 每件事做完立即写入页面存储和预处理日志，并通过 on_update(page_index, done, total) 通知界面
+    # - focus() 设定当前页和随后几页，当前页优先；翻页后未开始的旧任务直接作废
+    def __init__(self, document_text, language_unit, journal_path, on_update=None):
+        self.document_text = document_text
+        self.language_unit = language_unit
+        self.on_update = on_update
+        self.journal = PreprocessJournal(journal_path)
+        self.scheduler = LLMScheduler(max_workers=1)
+        # 页下标 -> 优先级，数值越小越先处理
+        self.wanted = {}
+        self.condition = threading.Condition()
+        self.stopped = False
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def focus(self, page_index, warm_pages=()):
+        with self.condition:
+            self.wanted = {page_index: 0}
+            for priority, warm_page in enumerate(warm_pages, start=1):
+                self.wanted.setdefault(warm_page, priority)
+            self.condition.notify()
+
+    def next_item(self, page_index):
+        english = self.document_text.paragraphs[page_index]
+        chinese = self.document_text.translated_paragraphs[page_index]
+        if len(chinese) < len(english):
+            return "translation"
+        if english and not self.document_text.page_summary_200[page_index]:
+            return "summary"
+        return None
+
+    def run(self):
+        # 预处理日志由工作线程在退出时关闭：close() 等待超时后，正在进行的请求仍可能写日志
+        try:
+            self.process()
+        finally:
+            self.journal.close()
+
+    def process(self):
+        # 模型在后台加载，就绪之前不发请求
+        while not self.language_unit.model_ready.wait(MODEL_WAIT_INTERVAL):
+            if self.stopped:
+                return
+        while True:
+            with self.condition:
+                while not self.stopped and not self.wanted:
+                    self.condition.wait()
+                if self.stopped:
+                    return
+                page_index = min(self.wanted, key=self.wanted.get)
+            try:
+                item = self.next_item(page_index)
+                if item is None:
+                    with self.condition:
+                        if self.wanted.get(page_index) is not None:
+                            del self.wanted[page_index]
+                    continue
+                if item == "translation":
+                    self.translate_next(page_index)
+                else:
+                    self.summarize(page_index)
+            except Exception as e:
+                # 重试仍失败时放弃这一页，等下次打开时再试
+                print(f"第 {page_index + 1} 页处理失败：{e}")
+                with self.condition:
+                    self.wanted.pop(page_index, None)
+
+    def translate_next(self, page_index):
+        english = self.document_text.paragraphs[page_index]
+        chinese = list(self.document_text.translated_paragraphs[page_index])
+        paragraph_chinese = self.scheduler.submit(self.document_text.translate_paragraph, self.language_unit,
+                                                  self.journal, english[len(chinese)]).result()
+        if self.stopped:
+            return
+        chinese.append(paragraph_chinese)
+        self.document_text.store.update_page(page_index, chinese=chinese)
+        self.notify(page_index)
+
+    def summarize(self, page_index):
+        summaries = self.scheduler.submit(self.document_text.summarize_page, self.language_unit, self.journal,
+                                          page_index).result()
+        if self.stopped:
+            return
+        self.document_text.store.update_page(page_index, summary_100=summaries[100], summary_200=summaries[200],
+                                             summary_300=summaries[300])
+        self.notify(page_index)
+
+    def notify(self, page_index):
+        if self.on_update is not None:
+            total = len(self.document_text.paragraphs[page_index])
+            done = len(self.document_text.translated_paragraphs[page_index])
+            self.on_update(page_index, done, total)
+
+    def close(self):
+        with self.condition:
+            self.stopped = True
+            self.condition.notify()
+        # 正在进行的 LLM 请求无法中断，最多等 STOP_TIMEOUT 秒；超时后它的结果不再写入页面存储，
+        # 失败也不再重试，日志在它结束后由工作线程关闭
+        self.scheduler.shutdown(wait=False)
+        self.thread.join(STOP_TIMEOUT)
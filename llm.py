@@ -1,69 +1,336 @@
-import ollama
-from utils import replace_multiple_spaces_with_one
+from utils import replace_multiple_spaces_with_one, parse_summaries, number_segments, parse_numbered_segments, \
+    estimate_tokens, pack_paragraphs, split_sentences
+from prompts import TRANSLATE_TEMPLATE, TRANSLATE_BATCH_TEMPLATE, SUMMARIZE_TEMPLATE, SUMMARIZE_ALL_TEMPLATE, \
+    DIGEST_TEMPLATE, join_paragraphs, book_assistant_prompt
+from memory import ConversationMemory
+from response_cache import ResponseCache, request_key, semantic_scope
+from translation_memory import TranslationMemory, TRANSLATION_MEMORY_PATH
+from model_selection import ensure_model
+from tracing import traced, annotate, record, count
+from collections import deque
+import threading
+import time
 MODEL_CARDS = ["glm4:9b",
                "qwen2.5:7b", "qwen2.5:14b", "qwen2.5-coder:7b", "qwen2.5-coder:14b",
                "deepseek-coder-v2:16b"]
-import os
+SUMMARY_LENGTHS = (100, 200, 300)
+CALL_STATS_SIZE = 1000
+# 聊天上下文的 token 预算，需给回复留出余量（Ollama 默认上下文窗口为 2048）
+CHAT_TOKEN_BUDGET = 1536
+DIGEST_LENGTH = 150
+EMBEDDING_MODEL = "nomic-embed-text"
+RESPONSE_CACHE_PATH = "response_cache.db"
+# 近似问题复用回复需要先 ollama pull EMBEDDING_MODEL
+USE_SEMANTIC_CACHE = False
+# 预热请求只生成一个 token，用来把模型加载进显存并让 Ollama 缓存 system 提示的 KV
+WARM_UP_PROMPT = "你好"
+# 总结前先做抽取式压缩：超过 SUMMARY_COMPRESS_MIN_TOKENS 的页面只保留约 SUMMARY_INPUT_RATIO 的句子，减少 prefill
+COMPRESS_SUMMARY_INPUT = True
+SUMMARY_COMPRESS_MIN_TOKENS = 300
+SUMMARY_INPUT_RATIO = 0.6
+# 翻译记忆未命中的句子编号后打包翻译；一段有好几句，每批的段数要比按段落打包时多，请求数才不会增加
+MEMORY_BATCH_TOKENS = 600
+MEMORY_BATCH_SEGMENTS = 32
 
 
 class OllamaLLM:
-    def __init__(self, model_name):
+    def __init__(self, model_name, host=None, response_cache=None, semantic_cache=False):
         self.model_name = model_name
+        # host 为 None 时使用默认的本地 Ollama 服务（或环境变量 OLLAMA_HOST）
+        self.host = host
+        self.ollama_client = None
+        # 最近若干次调用的 token 数与耗时，prompt_tokens 只统计实际做了 prefill 的部分，命中 KV 缓存的前缀不计入
+        self.call_stats = deque(maxlen=CALL_STATS_SIZE)
+        # 命中 response_cache 的请求不发给 Ollama；semantic_cache 为真时，聊天提问还会按 embedding 找近似的问题
+        self.response_cache = response_cache
+        self.semantic_cache = semantic_cache
 
-    def __call__(self, input_text, message_history):
+    @property
+    def client(self):
+        # ollama 及其依赖（httpx、pydantic）导入较慢，第一次发请求时才创建客户端
+        if self.ollama_client is None:
+            import ollama
+            self.ollama_client = ollama.Client(host=self.host)
+        return self.ollama_client
+
+    def pull(self):
+        ensure_model(self.client, self.model_name)
+
+    def prefill_ms_per_token(self):
+        # 最近若干次请求实测的 prefill 速度，还没有请求时为 0
+        call_stats = list(self.call_stats)
+        prompt_tokens = sum(item["prompt_tokens"] for item in call_stats)
+        return sum(item["prompt_eval_ms"] for item in call_stats) / prompt_tokens if prompt_tokens else 0.0
+
+    @traced("llm.warm_up")
+    def warm_up(self, system_prompt):
+        start = time.perf_counter()
+        response = self.client.chat(model=self.model_name, options={"num_predict": 1},
+                                    messages=[{'role': "system", 'content': system_prompt},
+                                              {'role': "user", 'content': WARM_UP_PROMPT}])
+        annotate(model=self.model_name, **self.response_stats(response, start))
+
+    def embed(self, texts, model_name=EMBEDDING_MODEL):
+        return self.client.embed(model=model_name, input=list(texts))['embeddings']
+
+    def lookup(self, message_history, options, semantic_query, semantic_context):
+        # 返回 (缓存的回复或 None, 写回缓存用的参数)。
+        # 近似匹配只对 semantic_query（用户的提问本身）做 embedding；随提问发送的检索段落、回复长度等放进
+        # semantic_context，只有它们也相同时才比较提问的相似度
+        key = request_key(self.model_name, message_history, options)
+        output_text = self.response_cache.get(key)
+        scope = vector = None
+        if output_text is None and semantic_query is not None and self.semantic_cache:
+            scope = semantic_scope(self.model_name, message_history, options, context=semantic_context)
+            vector = self.embed([semantic_query])[0]
+            output_text = self.response_cache.get_similar(scope, vector)
+        return output_text, (key, scope, vector)
+
+    @staticmethod
+    def response_stats(response, start):
+        return {
+            "prompt_tokens": response['prompt_eval_count'] or 0,
+            "completion_tokens": response['eval_count'] or 0,
+            "prompt_eval_ms": (response['prompt_eval_duration'] or 0) / 1e6,
+            "eval_ms": (response['eval_duration'] or 0) / 1e6,
+            "load_ms": (response['load_duration'] or 0) / 1e6,
+            "latency_ms": (time.perf_counter() - start) * 1000,
+        }
+
+    @traced("llm.call")
+    def __call__(self, input_text, message_history, semantic_query=None, semantic_context=None, **kwargs):
         # Setting up the model, enabling streaming responses, and defining the input messages
         message_history.append({'role': "user", 'content': input_text})
-        ollama_response = ollama.chat(model=self.model_name, messages=message_history)
+        annotate(model=self.model_name, messages=len(message_history))
+        if self.response_cache is not None:
+            output_text, cache_entry = self.lookup(message_history, kwargs, semantic_query, semantic_context)
+            if output_text is not None:
+                annotate(cached=True)
+                count("llm.cache_hits")
+                message_history.append({'role': "assistant", 'content': output_text})
+                return output_text
+        start = time.perf_counter()
+        ollama_response = self.client.chat(model=self.model_name, messages=message_history, **kwargs)
+        stats = self.response_stats(ollama_response, start)
+        self.call_stats.append(stats)
+        annotate(**stats)
+        count("llm.requests")
         # Printing out of the generated response
         output_text = ollama_response['message']['content']
         output_text = output_text.replace("\n", "")
+        if self.response_cache is not None:
+            key, scope, vector = cache_entry
+            self.response_cache.put(key, output_text, scope=scope, vector=vector)
         message_history.append({'role': "assistant", 'content': output_text})
         return output_text
 
+    def stream(self, input_text, message_history, cancel_event=None, semantic_query=None, semantic_context=None,
+               **kwargs):
+        # 流式版本的 __call__：逐块产出回复文本。cancel_event 被置位时停止读取并关闭连接，
+        # Ollama 随之中止生成；被取消的回复不写入 message_history，也不写入缓存。
+        message_history.append({'role': "user", 'content': input_text})
+        if self.response_cache is not None:
+            output_text, cache_entry = self.lookup(message_history, kwargs, semantic_query, semantic_context)
+            if output_text is not None:
+                count("llm.cache_hits")
+                yield output_text
+                message_history.append({'role': "assistant", 'content': output_text})
+                return
+        start = time.perf_counter()
+        count("llm.requests")
+        # 生成器会跨越多次 yield，不放进当前线程的 span 栈，结束时整体记录一个 llm.stream span
+        stats = {"model": self.model_name, "messages": len(message_history), "cancelled": True}
+        first_token_time = None
+        chunks = []
+        response = self.client.chat(model=self.model_name, messages=message_history, stream=True, **kwargs)
+        try:
+            for chunk in response:
+                if cancel_event is not None and cancel_event.is_set():
+                    return
+                text = chunk['message']['content'].replace("\n", "")
+                if text:
+                    if first_token_time is None:
+                        first_token_time = time.perf_counter()
+                    chunks.append(text)
+                    yield text
+                if chunk['done']:
+                    call_stats = self.response_stats(chunk, start)
+                    call_stats["ttft_ms"] = ((first_token_time or time.perf_counter()) - start) * 1000
+                    self.call_stats.append(call_stats)
+                    stats.update(call_stats, cancelled=False)
+        finally:
+            response.close()
+            record("llm.stream", start, **stats)
+        output_text = "".join(chunks)
+        if self.response_cache is not None:
+            key, scope, vector = cache_entry
+            self.response_cache.put(key, output_text, scope=scope, vector=vector)
+        message_history.append({'role': "assistant", 'content': output_text})
+
 
 class LanguageProcessor:
-    def __init__(self, model_name):
-        os.system(f"ollama pull {model_name}")
-        self.llm = OllamaLLM(model_name=model_name)
-        content = ("You are an AI assistant to help reader read the book <<THE COMING WAVE>> written "
-                   "by Mustafa Suleymam, a cofounder of DeepMind.")
-        self.long_term_history = [{'role': 'system', 'content': content}]
-
-    def chat(self, input_text, text_length):
+    def __init__(self, model_name, host=None, response_cache_path=RESPONSE_CACHE_PATH,
+                 semantic_cache=USE_SEMANTIC_CACHE, compress_summaries=COMPRESS_SUMMARY_INPUT,
+                 translation_memory_path=TRANSLATION_MEMORY_PATH):
+        # response_cache_path 为 None 时不缓存回复（例如压测时）
+        response_cache = None if response_cache_path is None else ResponseCache(response_cache_path)
+        # translation_memory_path 为 None 时不用翻译记忆，整段发给模型翻译
+        self.translation_memory = None if translation_memory_path is None else \
+            TranslationMemory(translation_memory_path)
+        self.llm = OllamaLLM(model_name=model_name, host=host, response_cache=response_cache,
+                             semantic_cache=semantic_cache)
+        # 构造时不访问 Ollama；load_model 完成前发出的请求要由 Ollama 临时加载模型，本地没有该模型时会失败
+        self.model_ready = threading.Event()
+        self.compress_summaries = compress_summaries
+        self.memory = ConversationMemory(book_assistant_prompt(), CHAT_TOKEN_BUDGET, digest_fn=self.digest)
+
+    def load_model(self, model_name=None):
+        # 确保模型在本地、加载进显存并预热，耗时可能很长，阅读器在后台线程里调用；model_name 不为 None 时先换模型
+        if model_name is not None:
+            self.llm.model_name = model_name
+        self.llm.pull()
+        self.llm.warm_up(self.memory.system_prompt)
+        self.model_ready.set()
+
+    def compress_context(self, paragraph_list, token_budget, query=None):
+        # 抽取式压缩（见 compression.compress），返回与 paragraph_list 一一对应的列表；
+        # 按最近实测的 prefill 速度估算省下的时间，记在当前 span 上
+        from compression import compress
+
+        compressed = compress(paragraph_list, token_budget, query=query)
+        saved_tokens = sum(estimate_tokens(paragraph) for paragraph in paragraph_list) - \
+            sum(estimate_tokens(paragraph) for paragraph in compressed)
+        annotate(saved_prompt_tokens=saved_tokens, saved_prefill_ms=saved_tokens * self.llm.prefill_ms_per_token())
+        return compressed
+
+    def summary_input(self, paragraph_list):
+        tokens = sum(estimate_tokens(paragraph) for paragraph in paragraph_list)
+        if not self.compress_summaries or tokens <= SUMMARY_COMPRESS_MIN_TOKENS:
+            return paragraph_list
+        return [paragraph for paragraph in self.compress_context(paragraph_list, int(tokens * SUMMARY_INPUT_RATIO))
+                if paragraph]
+
+    def set_document(self, title, author=""):
+        # 换书时只换 system 提示并清空对话，模型无需重新加载
+        self.memory.clear(system_prompt=book_assistant_prompt(title, author))
+        if self.translation_memory is not None:
+            self.translation_memory.reset_stats()
+
+    def set_page_context(self, page_context):
+        self.memory.set_page_context(page_context)
+
+    def prepare_chat(self, input_text, text_length, reference=None):
+        # reference（如检索到的全书段落）只随本轮请求发送，不写入对话记忆。
+        # 返回的 semantic 参数供近似缓存使用：只对提问本身做 embedding，reference 和回复长度作为 context
+        # 上一轮淘汰下来的对话在这里并入摘要，不占用上一轮回复的时间
+        semantic = {"semantic_query": input_text, "semantic_context": [reference, text_length]}
         input_text = input_text + "\n\n" + f"请在{text_length}字以内做出回复。"
-        output_text = self.llm(input_text, self.long_term_history)
+        prompt_text = input_text if reference is None else reference + "\n\n" + input_text
+        self.memory.update_digest()
+        with self.memory.lock:
+            prompt_tokens = self.memory.record_prompt(prompt_text)
+            message_history = self.memory.messages()
+        print(f"chat prompt: ~{prompt_tokens} tokens, {len(message_history)} messages in context")
+        return input_text, prompt_text, message_history, semantic
+
+    @traced("language.chat")
+    def chat(self, input_text, text_length, reference=None):
+        input_text, prompt_text, message_history, semantic = self.prepare_chat(input_text, text_length, reference)
+        output_text = self.llm(prompt_text, message_history, **semantic)
+        self.memory.add_exchange(input_text, output_text)
         return output_text
 
+    def chat_stream(self, input_text, text_length, reference=None, cancel_event=None, on_done=None):
+        # 逐块产出回复；完整收到回复后先调用 on_done（界面据此结束这一轮），再写入对话记忆，
+        # 中途取消的这一轮不会留在上下文里
+        input_text, prompt_text, message_history, semantic = self.prepare_chat(input_text, text_length, reference)
+        chunks = []
+        for text in self.llm.stream(prompt_text, message_history, cancel_event=cancel_event, **semantic):
+            chunks.append(text)
+            yield text
+        if cancel_event is None or not cancel_event.is_set():
+            if on_done is not None:
+                on_done()
+            self.memory.add_exchange(input_text, "".join(chunks))
+
+    def digest(self, digest, evicted_turns):
+        message_history = DIGEST_TEMPLATE.history(digest_length=DIGEST_LENGTH)
+        turns = "".join(f"\n {turn['role']}: {turn['content']}" for turn in evicted_turns)
+        text = DIGEST_TEMPLATE.render(digest=digest or "(empty)", turns=turns)
+        return replace_multiple_spaces_with_one(self.llm(text, message_history))
+
+    @traced("language.summarize")
     def summarize(self, paragraph_list, summary_length):
-        message_history = []
-        prompt = ("In the next turn of conversation, you will be given a few paragraphs of an article. You are "
-                  "supposed to write a summary of them.")
-        self.llm(prompt, message_history)
-        requirements = f"""
-        1. The summary must be strictly within {summary_length} words.\n
-        2. The language of the summary must be simplified Chinese.\n
-        3. The summary must be clear, explicit, easily-understood, fluent and smooth.\n
-        """
-        text = f"""Your summary must strictly follow the requirements below: \n
-        {requirements}
-        The paragraphs from an article are as follows:"""
-        for item in paragraph_list:
-            paragraph = item["paragraph"] if type(item)==dict else item
-            text += "\n " + paragraph
+        message_history = SUMMARIZE_TEMPLATE.history()
+        text = SUMMARIZE_TEMPLATE.render(summary_length=summary_length, paragraphs=join_paragraphs(paragraph_list))
         summary = self.llm(text, message_history)
         summary = replace_multiple_spaces_with_one(summary)
         return summary
 
+    @traced("language.summarize_all")
+    def summarize_all(self, paragraph_list, summary_lengths=SUMMARY_LENGTHS):
+        # 一次请求生成所有长度的总结（JSON 输出），代替每个长度各自两轮对话。
+        # 输出缺项或无法解析时，由已有的较长总结压缩出较短的，实在没有才回退到逐个总结。
+        paragraph_list = self.summary_input(paragraph_list)
+        keys = ", ".join(f'"{length}"' for length in summary_lengths)
+        message_history = SUMMARIZE_ALL_TEMPLATE.history(keys=keys)
+        text = SUMMARIZE_ALL_TEMPLATE.render(paragraphs=join_paragraphs(paragraph_list))
+        output = self.llm(text, message_history, format="json")
+        summaries = parse_summaries(output, summary_lengths)
+        for summary_length in sorted(summary_lengths, reverse=True):
+            if summary_length in summaries:
+                continue
+            longer_lengths = [length for length in summaries if length > summary_length]
+            if longer_lengths:
+                source = [summaries[min(longer_lengths)]]
+                summaries[summary_length] = self.summarize(source, summary_length)
+            else:
+                summaries[summary_length] = self.summarize(paragraph_list, summary_length)
+        return summaries
+
     def translate(self, text_english):
-        message_history = []
-        requirements = f"""
-                1. The translation into simplified Chinese must be easily understood.\n
-                2. Only output the translated text. Extra information is unwanted.\n
-                """
-        prompt = (f"In the next turn of conversation, you will be given a piece of text in English. You are "
-                  f"supposed to translate it into simplified Chinese. And you must follow the requirements as "
-                  f"follows: \n {requirements}")
-        self.llm(prompt, message_history)
-        content = f"The text in English is as follows: \n {text_english}"
-        text_chinese = self.llm(content, message_history)
+        return self.translate_batch([text_english])[0]
+
+    def translate_batch(self, paragraph_list):
+        if self.translation_memory is None:
+            return self.translate_paragraphs(paragraph_list)
+        return self.translate_with_memory(paragraph_list)
+
+    @traced("language.translate_memory")
+    def translate_with_memory(self, paragraph_list):
+        # 把段落拆成句子逐句查翻译记忆，只把没命中的句子（去重后）编号打包发给模型，
+        # 译文写回记忆，再按原来的顺序把每段的中文句子拼起来
+        sentence_lists = [split_sentences(paragraph) for paragraph in paragraph_list]
+        translations = {}
+        for sentences in sentence_lists:
+            for sentence in sentences:
+                if sentence not in translations:
+                    translations[sentence] = self.translation_memory.lookup(sentence)
+        missing = [sentence for sentence, sentence_chinese in translations.items() if sentence_chinese is None]
+        annotate(sentences=len(translations), missing_sentences=len(missing))
+        for batch in pack_paragraphs(missing, MEMORY_BATCH_TOKENS, MEMORY_BATCH_SEGMENTS):
+            for sentence, sentence_chinese in zip(batch, self.translate_paragraphs(batch)):
+                translations[sentence] = sentence_chinese
+                self.translation_memory.add(sentence, sentence_chinese)
+        return ["".join(translations[sentence] for sentence in sentences) for sentences in sentence_lists]
+
+    @traced("language.translate")
+    def translate_text(self, text_english):
+        message_history = TRANSLATE_TEMPLATE.history()
+        text_chinese = self.llm(TRANSLATE_TEMPLATE.render(text=text_english), message_history)
         return text_chinese
+
+    @traced("language.translate_batch")
+    def translate_paragraphs(self, paragraph_list):
+        # 把若干段编号后放进一次请求翻译，省去逐段请求的 prefill 和往返开销。
+        # 输出的段数与输入对不上时，把这一批对半拆开分别重试，直到退化为逐段翻译。
+        if len(paragraph_list) == 1:
+            return [self.translate_text(paragraph_list[0])]
+        message_history = TRANSLATE_BATCH_TEMPLATE.history()
+        output = self.llm(TRANSLATE_BATCH_TEMPLATE.render(segments=number_segments(paragraph_list)),
+                          message_history)
+        translations = parse_numbered_segments(output, len(paragraph_list))
+        if translations is not None:
+            return translations
+        middle = len(paragraph_list) // 2
+        return self.translate_paragraphs(paragraph_list[:middle]) + self.translate_paragraphs(paragraph_list[middle:])
@@ -1,43 +1,86 @@
+import time
+# 冷启动计时的起点，放在其他导入之前
+START_TIME = time.perf_counter()
 import sys
-import fitz  # PyMuPDF
+import argparse
 from PyQt6.QtWidgets import (QApplication, QMainWindow, QPushButton, QTextEdit, QLabel, QVBoxLayout,
-                             QWidget, QHBoxLayout, QStackedWidget)
-from PyQt6.QtGui import QFont, QTextCursor, QTextCharFormat
-from PyQt6.QtCore import Qt, QEvent
+                             QWidget, QHBoxLayout, QStackedWidget, QCheckBox, QGridLayout, QFileDialog, QListView)
+from PyQt6.QtGui import QFont, QTextDocument, QColor
+from PyQt6.QtCore import Qt, QEvent, QThread, QObject, QTimer, pyqtSignal, QAbstractListModel, QModelIndex
 import re
-from utils import print_gpu_info, get_recommended_llm
-from llm import LanguageProcessor
+import threading
+import queue
+from utils import print_gpu_info
+from llm import LanguageProcessor, EMBEDDING_MODEL, MODEL_CARDS
+from model_selection import ModelSelector
+from document_text import DocumentText
+from chat_log import ChatLog
+from documents import DocumentRegistry
+from page_context import PageContextCache
+from tracing import tracer, traced, annotate, record
+from page_render import PageRenderCache, VIEWS, PREFETCH_RADIUS, RENDER_CACHE_SIZE
+from lazy_preprocess import LazyPreprocessor, WARM_PAGES
 import os
-from tqdm import tqdm
-import json
 from functools import partial
+from collections import OrderedDict, deque
 
 
-FIRST_PAGE = 15
-LAST_PAGE = 306
 FILE_PATH = "THE COMING WAVE.pdf"
+# 随项目分发的《The Coming Wave》预处理结果，首次打开这本书时导入它的缓存
 PROCESSED_TEXT_PATH = "processed_texts.json"
+# 这本书的 PDF 目录不完整，页范围和章节沿用人工整理的版本；其他 PDF 从目录中推断
+BUNDLED_BOOK = {
+    "title": "THE COMING WAVE",
+    "author": "Mustafa Suleymam, a cofounder of DeepMind",
+    "first_page": 15,
+    "last_page": 306,
+    "chapters": [("Containment Is Not Possible", 18), ("Endless Proliferation", 34),
+                 ("The Containment Problem", 47), ("The Technology of Intelligence", 62),
+                 ("The Technology of Life", 92), ("The Wild Wave", 106), ("Four Features of the Coming Wave", 118),
+                 ("Unstoppable Incentives", 133), ("Grand Bargain", 163), ("Fragility Amplifiers", 177),
+                 ("The Future of Nations", 201), ("The Dilemma", 224)],
+}
+# 没有预处理过的页面在打开时才翻译和总结
+LAZY_PREPROCESS = True
 BUTTON_HEIGHT = 35
 TEXT_DISPLAY_WIDTH = 1100
 
-ENGLISH_FONT = QFont("Georgia")
-ENGLISH_FONT.setPointSize(14)
-ENGLISH_FORMAT = QTextCharFormat()
-ENGLISH_FORMAT.setFont(ENGLISH_FONT)
-
+# 页面正文的字体和字号见 page_render 中的样式
 CHINESE_FONT = QFont("SimHei")
 CHINESE_FONT.setPointSize(15)
-CHINESE_FORMAT = QTextCharFormat()
-CHINESE_FORMAT.setFont(CHINESE_FONT)
-
-SUMMARY_FONT = QFont("SimHei")
-SUMMARY_FONT.setPointSize(12)
-SUMMARY_FORMAT = QTextCharFormat()
-SUMMARY_FORMAT.setFont(SUMMARY_FONT)
 RESPONSE_LENGTH = 250
+CHAT_FONT = QFont()
+CHAT_FONT.setPixelSize(16)
+CHAT_STATUS_FONT = QFont()
+CHAT_STATUS_FONT.setPixelSize(12)
+# 对话记录中各类消息的前缀和颜色；session 是每次启动后第一条消息前的时间标记
+CHAT_ROLES = {"user": ("你：", "black"), "assistant": ("AI：", "#1f4e9c"), "status": ("", "gray"),
+              "session": ("—— ", "gray")}
+# 流式回复时最后一条消息的高度会变，重新布局最多每隔这么久一次
+CHAT_LAYOUT_INTERVAL_MS = 50
+SEND_BUTTON_TEXT = "点击此按钮/按回车(Enter)发送消息"
+MODEL_LOADING_TEXT = "模型加载中……"
+MODEL_FAILED_TEXT = "模型加载失败"
+STOP_BUTTON_TEXT = "停止生成"
+# 对话线程检查是否已取消的间隔（秒）
+CHAT_CANCEL_POLL_INTERVAL = 0.1
+
+RETRIEVAL_TOP_K = 5
+# 检索到的段落按与提问的相关度抽取句子，压缩到这个 token 数以内
+RETRIEVAL_CONTEXT_TOKENS = 400
+# 向量检索需要先 ollama pull 对应的 embedding 模型
+USE_DENSE_RETRIEVAL = False
 
 MENU_BUTTON_WIDTH = 50
 MENU_BUTTON_HEIGHT = 100
+MENU_COLUMNS = 4
+RENDER_STATS_SIZE = 200
+# 定期把追踪数据写到本地文件：span 明细追加到 JSONL，累计值写成 Prometheus 文本格式
+EXPORT_METRICS = False
+METRICS_JSONL_PATH = "metrics.jsonl"
+METRICS_PROMETHEUS_PATH = "metrics.prom"
+METRICS_EXPORT_INTERVAL_MS = 10000
+STATS_REFRESH_INTERVAL_MS = 1000
 
 
 def is_valid_string(s):
@@ -48,99 +91,220 @@ def is_valid_string(s):
     return bool(re.fullmatch(pattern, s))
 
 
-def save_json(data, path):
-    with open(path, "w") as f:
-        json.dump(data, f)
+class RenderSignals(QObject):
+    # PageRenderCache 和 LazyPreprocessor 在后台线程回调，通过信号转回 UI 线程
+    page_ready = pyqtSignal(int)
+    page_updated = pyqtSignal(int, int, int)
 
 
-def load_json(path):
-    with open(path, "r") as f:
-        return json.load(f)
+class ModelSignals(QObject):
+    # 后台线程选好、加载并预热模型后通知界面
+    ready = pyqtSignal(str)
+    failed = pyqtSignal(str)
 
 
-class DocumentText:
+class StatsPanel(QWidget):
+    # 应用内的统计面板：各类操作的次数、平均/最大耗时、token 数，以及计数器，每秒刷新
     def __init__(self):
-        self.paragraphs = [[] for _ in range(LAST_PAGE + 1)]
-        self.translated_paragraphs = [[] for _ in range(LAST_PAGE + 1)]
-        self.page_summary_100 = ["" for _ in range(LAST_PAGE + 1)]
-        self.page_summary_200 = ["" for _ in range(LAST_PAGE + 1)]
-        self.page_summary_300 = ["" for _ in range(LAST_PAGE + 1)]
-        if os.path.exists(PROCESSED_TEXT_PATH):
-            self.load()
+        super().__init__()
+        self.setWindowTitle("统计")
+        self.setGeometry(100, 100, 900, 500)
+        layout = QVBoxLayout(self)
+        self.text_display = QTextEdit(self)
+        self.text_display.setReadOnly(True)
+        self.text_display.setFont(QFont("Consolas", 10))
+        layout.addWidget(self.text_display)
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self.refresh)
+
+    def showEvent(self, event):
+        self.refresh()
+        self.timer.start(STATS_REFRESH_INTERVAL_MS)
+        super().showEvent(event)
+
+    def hideEvent(self, event):
+        self.timer.stop()
+        super().hideEvent(event)
+
+    def refresh(self):
+        rows, counters = tracer.summary()
+        lines = [f"{'span':<26} {'count':>7} {'avg ms':>10} {'max ms':>10} {'prompt tok':>11} {'output tok':>11}"]
+        for name, span_count, average_ms, max_ms, totals in rows:
+            lines.append(f"{name:<26} {span_count:>7} {average_ms:>10.1f} {max_ms:>10.1f} "
+                         f"{totals.get('prompt_tokens', 0):>11} {totals.get('completion_tokens', 0):>11}")
+        compression = next((totals for name, _, _, _, totals in rows if name == "context.compress"), None)
+        if compression and compression.get("original_tokens"):
+            saved_ms = sum(totals.get("saved_prefill_ms", 0) for _, _, _, _, totals in rows)
+            lines.append(f"\n上下文压缩：{compression['original_tokens']} → {compression['compressed_tokens']} tokens"
+                         f"（{compression['compressed_tokens'] / compression['original_tokens']:.0%}），"
+                         f"预计节省 prefill {saved_ms:.0f} 毫秒")
+        lines.append("")
+        lines += [f"{name:<26} {value:>7}" for name, value in sorted(counters.items())]
+        self.text_display.setPlainText("\n".join(lines))
+
+
+class ChatListModel(QAbstractListModel):
+    # 对话记录的列表模型，数据来自磁盘上的 ChatLog：打开时只读最后一页，视图滚到顶部时再往前读一页，
+    # 不会把整段历史重放进界面。QListView 只绘制可见的几行，追加消息不必重排整段文本。
+    def __init__(self, chat_log, parent=None):
+        super().__init__(parent)
+        self.chat_log = chat_log
+        # [id, role, text]，按时间顺序
+        self.rows = []
+        self.has_older = True
+        self.load_older()
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.rows)
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+        _, message_role, text = self.rows[index.row()]
+        prefix, color = CHAT_ROLES.get(message_role, ("", "black"))
+        if role == Qt.ItemDataRole.DisplayRole:
+            return prefix + text + (" ——" if message_role == "session" else "")
+        if role == Qt.ItemDataRole.ForegroundRole:
+            return QColor(color)
+        if role == Qt.ItemDataRole.FontRole:
+            return CHAT_FONT if message_role in ("user", "assistant") else CHAT_STATUS_FONT
+        if role == Qt.ItemDataRole.TextAlignmentRole and message_role == "session":
+            return Qt.AlignmentFlag.AlignCenter
+        return None
+
+    def load_older(self):
+        # 返回读到的条数
+        if not self.has_older:
+            return 0
+        older = self.chat_log.messages(before_id=self.rows[0][0] if self.rows else None)
+        self.has_older = bool(older)
+        if older:
+            self.beginInsertRows(QModelIndex(), 0, len(older) - 1)
+            self.rows[:0] = [list(message) for message in older]
+            self.endInsertRows()
+        return len(older)
+
+    def append(self, role, text):
+        # 写入磁盘并追加到末尾，返回这条消息的 id
+        written = self.chat_log.append(role, text)
+        self.beginInsertRows(QModelIndex(), len(self.rows), len(self.rows) + len(written) - 1)
+        self.rows += [list(message) for message in written]
+        self.endInsertRows()
+        return self.rows[-1][0]
+
+    def row_of(self, message_id):
+        # 行号会因 load_older 在前面插入而变化，流式回复按 id 找行；它总在末尾附近，从后往前找
+        for row in range(len(self.rows) - 1, -1, -1):
+            if self.rows[row][0] == message_id:
+                return row
+        return None
+
+    def append_text(self, message_id, text):
+        # 流式回复的增量只更新内存中的这一行，结束时由 save 写入磁盘
+        row = self.row_of(message_id)
+        if row is not None:
+            self.rows[row][2] += text
+            index = self.index(row)
+            self.dataChanged.emit(index, index)
+
+    def save(self, message_id):
+        row = self.row_of(message_id)
+        if row is not None:
+            self.chat_log.update(message_id, self.rows[row][2])
+
+
+class ChatWorker(QThread):
+    # 在后台线程里完成一轮对话：先执行 prepare（全书检索等），再流式接收回复。
+    # 信号由 Qt 排队送回 UI 线程，界面在整个过程中保持可操作；cancel() 后尽快停止并发出 cancelled。
+    # 检索和请求放在另一个守护线程里，本线程只转发结果：检索或 prefill 期间取消时不必等第一个 token，
+    # 本线程在 CHAT_CANCEL_POLL_INTERVAL 内退出，关窗、换书时的 wait() 不会卡住界面；迟到的回复被丢弃。
+    token_received = pyqtSignal(str)
+    first_token = pyqtSignal(float)
+    completed = pyqtSignal(float, float)
+    cancelled = pyqtSignal()
+    failed = pyqtSignal(str)
+
+    def __init__(self, language_unit, message, prepare, parent=None):
+        super().__init__(parent)
+        self.language_unit = language_unit
+        self.message = message
+        self.prepare = prepare
+        self.cancel_event = threading.Event()
+
+    def cancel(self):
+        self.cancel_event.set()
+
+    def produce(self, events):
+        try:
+            reference = self.prepare(self.cancel_event)
+            if not self.cancel_event.is_set():
+                # 回复收完就通知界面，写入对话记忆在这之后
+                for text in self.language_unit.chat_stream(self.message, RESPONSE_LENGTH, reference=reference,
+                                                           cancel_event=self.cancel_event,
+                                                           on_done=lambda: events.put(("done", None))):
+                    events.put(("token", text))
+        except Exception as e:
+            events.put(("failed", str(e)))
+
+    def run(self):
+        start = time.perf_counter()
+        first_token_seconds = None
+        events = queue.Queue()
+        threading.Thread(target=self.produce, args=(events,), daemon=True).start()
+        done = False
+        while not done and not self.cancel_event.is_set():
+            try:
+                kind, value = events.get(timeout=CHAT_CANCEL_POLL_INTERVAL)
+            except queue.Empty:
+                continue
+            if kind == "failed":
+                self.failed.emit(value)
+                return
+            if kind == "done":
+                done = True
+                continue
+            if first_token_seconds is None:
+                first_token_seconds = time.perf_counter() - start
+                self.first_token.emit(first_token_seconds)
+            self.token_received.emit(value)
+        # 回复已经收完时，之后再按停止也不算中断
+        if done:
+            self.completed.emit(first_token_seconds or 0.0, time.perf_counter() - start)
         else:
-            self.setup()
-
-    def is_empty_page(self, page_index):
-        return len(self.paragraphs[page_index]) == 0
-
-    def setup(self):
-        pdf_document = fitz.open(FILE_PATH)
-        paragraph = ""
-        for page_index in range(FIRST_PAGE, LAST_PAGE + 1):
-            page = pdf_document.load_page(page_index)
-            # 获取文本和其他元素
-            blocks = page.get_text("blocks")  # 提取文本内容
-            block_index = 0
-            for block in blocks:
-                block_text = block[4].replace("\n", " ").strip(" ")
-                if paragraph == "":
-                    paragraph = block_text
-                    block_index += 1
-                else:
-                    paragraph += " " + block_text
-
-                if not paragraph.endswith("."):
-                    continue
-
-                self.paragraphs[page_index].append(paragraph)
-                paragraph = ""
-
-    def preprocess(self, language_unit):
-        for page_index in tqdm(range(LAST_PAGE + 1)):
-            for paragraph_english in self.paragraphs[page_index]:
-                paragraph_chinese = language_unit.translate(paragraph_english)
-                self.translated_paragraphs[page_index].append(paragraph_chinese)
-            if len(self.paragraphs[page_index]) > 0:
-                summary_100 = language_unit.summarize(self.paragraphs[page_index], 100)
-                self.page_summary_100[page_index] = summary_100
-                summary_200 = language_unit.summarize(self.paragraphs[page_index], 200)
-                self.page_summary_200[page_index] = summary_200
-                summary_300 = language_unit.summarize(self.paragraphs[page_index], 300)
-                self.page_summary_300[page_index] = summary_300
-        self.save()
-
-    def save(self):
-        data = {
-            "English": self.paragraphs,
-            "Chinese": self.translated_paragraphs,
-            "100-word summary": self.page_summary_100,
-            "200-word summary": self.page_summary_200,
-            "300-word summary": self.page_summary_300,
-        }
-        save_json(data, PROCESSED_TEXT_PATH)
-
-    def load(self):
-        data = load_json(PROCESSED_TEXT_PATH)
-        self.paragraphs = data["English"]
-        self.translated_paragraphs = data["Chinese"]
-        self.page_summary_100 = data["100-word summary"]
-        self.page_summary_200 = data["200-word summary"]
-        self.page_summary_300 = data["300-word summary"]
+            self.cancelled.emit()
 
 
 class PDFViewer(QMainWindow):
-    def __init__(self, model_name):
+    # 第一次把页面正文画到屏幕上时发出，参数为从进程启动算起的毫秒数
+    first_painted = pyqtSignal(float)
+
+    def __init__(self, model_name, pdf_path):
         super().__init__()
+        # 模型只加载一次，切换文档时只替换文档相关的状态。
+        # 窗口先用已处理好的文本显示出来，选模型、pull 和预热都在后台进行，完成前聊天不可用；
+        # model_name 为 None 时在后台按实测速度选择
         self.language_unit = LanguageProcessor(model_name)
+        self.model_signals = ModelSignals(self)
+        self.model_signals.ready.connect(self.on_model_ready)
+        self.model_signals.failed.connect(self.on_model_failed)
+        self.registry = DocumentRegistry()
+        self.document = None
+        self.document_text = None
+        self.page_renders = None
+        self.page_documents = OrderedDict()
+        self.render_signals = RenderSignals(self)
+        self.render_signals.page_ready.connect(self.on_page_rendered)
+        self.render_signals.page_updated.connect(self.on_page_updated)
+        self.lazy_preprocessor = None
+        # 最近若干次翻页的渲染耗时
+        self.render_stats = deque(maxlen=RENDER_STATS_SIZE)
 
-        self.setWindowTitle("The Coming Wave")
         self.setGeometry(50, 50, 1400, 900)
 
         self.english_line_width = 700
         self.chinese_line_width = 400
         self.chat_line_width = 500
-        self.current_page = FIRST_PAGE
-        self.document_text = DocumentText()
+        self.current_page = 0
 
         self.summary_length = 300
         # 创建主布局
@@ -168,6 +332,21 @@ class PDFViewer(QMainWindow):
         compare_display_button.clicked.connect(lambda: text_display_widget.setCurrentIndex(2))
         tab_button_layout.addWidget(compare_display_button)
 
+        open_document_button = QPushButton("打开文档")
+        open_document_button.setFixedHeight(BUTTON_HEIGHT)
+        open_document_button.clicked.connect(self.choose_document)
+        tab_button_layout.addWidget(open_document_button)
+
+        self.stats_panel = StatsPanel()
+        stats_button = QPushButton("统计")
+        stats_button.setFixedHeight(BUTTON_HEIGHT)
+        stats_button.clicked.connect(self.stats_panel.show)
+        tab_button_layout.addWidget(stats_button)
+        if EXPORT_METRICS:
+            self.metrics_timer = QTimer(self)
+            self.metrics_timer.timeout.connect(self.export_metrics)
+            self.metrics_timer.start(METRICS_EXPORT_INTERVAL_MS)
+
         # summary_display_button = QPushButton("中文总结")
         # summary_display_button.setFixedHeight(BUTTON_HEIGHT)
         # summary_display_button.clicked.connect(lambda: text_display_widget.setCurrentIndex(3))
@@ -184,6 +363,7 @@ class PDFViewer(QMainWindow):
         self.english_text_display.setFontPointSize(12)
         self.english_text_display.setMinimumWidth(TEXT_DISPLAY_WIDTH)
         text_display_widget.addWidget(self.english_text_display)
+        self.english_text_display.viewport().installEventFilter(self)
 
         # 中文窗口
         self.chinese_text_display = QTextEdit(self)
@@ -215,37 +395,12 @@ class PDFViewer(QMainWindow):
         self.summary_text_display.setMinimumWidth(TEXT_DISPLAY_WIDTH)
         self.summary_text_display.setFixedHeight(130)
         text_layout.addWidget(self.summary_text_display)
+        self.page_views = {"english": self.english_text_display, "chinese": self.chinese_text_display,
+                           "compare": self.compare_text_display, "summary": self.summary_text_display}
 
-        chapter1_button = self.create_menu_button(1, "Containment Is Not Possible", 18)
-        chapter2_button = self.create_menu_button(2, "Endless Proliferation", 34)
-        chapter3_button = self.create_menu_button(3, "The Containment Problem", 47)
-        chapter4_button = self.create_menu_button(4, "The Technology of Intelligence", 62)
-        chapter5_button = self.create_menu_button(5, "The Technology of Life", 92)
-        chapter6_button = self.create_menu_button(6, "The Wild Wave", 106)
-        chapter7_button = self.create_menu_button(7, "Four Features of the Coming Wave", 118)
-        chapter8_button = self.create_menu_button(8, "Unstoppable Incentives", 133)
-        chapter9_button = self.create_menu_button(9, "Grand Bargain", 163)
-        chapter10_button = self.create_menu_button(10, "Fragility Amplifiers", 177)
-        chapter11_button = self.create_menu_button(11, "The Future of Nations", 201)
-        chapter12_button = self.create_menu_button(12, "The Dilemma", 224)
-        menu_layer1_layout = QHBoxLayout()
-        menu_layer1_layout.addWidget(chapter1_button)
-        menu_layer1_layout.addWidget(chapter2_button)
-        menu_layer1_layout.addWidget(chapter3_button)
-        menu_layer1_layout.addWidget(chapter4_button)
-        menu_layer2_layout = QHBoxLayout()
-        menu_layer2_layout.addWidget(chapter5_button)
-        menu_layer2_layout.addWidget(chapter6_button)
-        menu_layer2_layout.addWidget(chapter7_button)
-        menu_layer2_layout.addWidget(chapter8_button)
-        menu_layer3_layout = QHBoxLayout()
-        menu_layer3_layout.addWidget(chapter9_button)
-        menu_layer3_layout.addWidget(chapter10_button)
-        menu_layer3_layout.addWidget(chapter11_button)
-        menu_layer3_layout.addWidget(chapter12_button)
-        text_layout.addLayout(menu_layer1_layout)
-        text_layout.addLayout(menu_layer2_layout)
-        text_layout.addLayout(menu_layer3_layout)
+        # 章节目录按文档的 PDF 目录生成，切换文档时重建
+        self.chapter_menu_layout = QGridLayout()
+        text_layout.addLayout(self.chapter_menu_layout)
 
         # 创建按钮布局
         self.page_button_layout = QHBoxLayout()
@@ -281,12 +436,24 @@ class PDFViewer(QMainWindow):
         chat_display_title.setStyleSheet("font-size: 20px; font-weight: bold;")
         chat_display_title.setFixedHeight(35)
         chat_layout.addWidget(chat_display_title)
-        self.chat_display = QTextEdit(self)
-        self.chat_display.setReadOnly(True)
-        self.chat_display.setFixedWidth(self.chat_line_width)
-        self.chat_display.setFontPointSize(13)
-        self.chat_display.setFixedHeight(520)
-        chat_layout.addWidget(self.chat_display)
+        self.chat_view = QListView(self)
+        self.chat_view.setWordWrap(True)
+        self.chat_view.setResizeMode(QListView.ResizeMode.Adjust)
+        self.chat_view.setVerticalScrollMode(QListView.ScrollMode.ScrollPerPixel)
+        self.chat_view.setSelectionMode(QListView.SelectionMode.NoSelection)
+        self.chat_view.setSpacing(2)
+        self.chat_view.setFixedWidth(self.chat_line_width)
+        self.chat_view.setFixedHeight(520)
+        self.chat_view.verticalScrollBar().valueChanged.connect(self.on_chat_scrolled)
+        chat_layout.addWidget(self.chat_view)
+        self.chat_log = None
+        self.chat_model = None
+        # 正在流式接收的回复的消息 id
+        self.reply_id = None
+        self.chat_layout_timer = QTimer(self)
+        self.chat_layout_timer.setSingleShot(True)
+        self.chat_layout_timer.setInterval(CHAT_LAYOUT_INTERVAL_MS)
+        self.chat_layout_timer.timeout.connect(self.relayout_chat)
         chat_input_title = QLabel("输入")
         chat_input_title.setStyleSheet("font-size: 20px; font-weight: bold;")
         chat_input_title.setFixedHeight(30)
@@ -299,8 +466,13 @@ class PDFViewer(QMainWindow):
         # self.chat_input.setFontPointSize(13)
         # self.chat_input.setMinimumHeight(200)
         chat_layout.addWidget(self.chat_input)
-        self.chat_input_button = QPushButton("点击此按钮/按回车(Enter)发送消息", self)
-        self.chat_input_button.clicked.connect(self.chat)
+        self.book_search_checkbox = QCheckBox("全书检索：从整本书中查找相关段落一并发送", self)
+        chat_layout.addWidget(self.book_search_checkbox)
+        self.book_index = None
+        self.chat_worker = None
+        self.chat_input_button = QPushButton(MODEL_LOADING_TEXT, self)
+        self.chat_input_button.setEnabled(False)
+        self.chat_input_button.clicked.connect(self.on_chat_button_clicked)
         self.chat_input_button.setFixedHeight(BUTTON_HEIGHT)
         chat_layout.addWidget(self.chat_input_button)
 
@@ -310,14 +482,107 @@ class PDFViewer(QMainWindow):
         self.layout.addLayout(chat_layout)
         self.layout.setAlignment(chat_layout, Qt.AlignmentFlag.AlignLeft)
 
+        self.open_document(pdf_path)
+        threading.Thread(target=self.load_model, args=(model_name,), daemon=True).start()
+
+    def load_model(self, model_name):
+        try:
+            print_gpu_info()
+        except Exception as e:
+            # 显卡信息只用于诊断，查询失败（如没有装 GPUtil 或 nvidia-smi）不影响加载模型
+            print(f"无法获取显卡信息：{e}")
+        try:
+            if model_name is None:
+                # 阅读器以聊天为主，按首字延迟选模型；离线 preprocess 可改用 ModelSelector.batch_model()
+                model_name = ModelSelector(MODEL_CARDS).chat_model()
+            self.language_unit.load_model(model_name)
+        except Exception as e:
+            self.model_signals.failed.emit(str(e))
+        else:
+            self.model_signals.ready.emit(model_name)
+
+    def on_model_ready(self, model_name):
+        self.chat_input_button.setText(SEND_BUTTON_TEXT)
+        self.chat_input_button.setEnabled(True)
+        self.statusBar().showMessage(f"模型 {model_name} 已就绪，启动后 {time.perf_counter() - START_TIME:.1f} 秒")
+
+    def on_model_failed(self, error):
+        self.chat_input_button.setText(MODEL_FAILED_TEXT)
+        self.statusBar().showMessage(f"模型加载失败：{error}")
+
+    def on_first_paint(self):
+        elapsed_ms = (time.perf_counter() - START_TIME) * 1000
+        record("app.first_paint", START_TIME)
+        print(f"first paint: {elapsed_ms:.1f} ms", flush=True)
+        self.first_painted.emit(elapsed_ms)
+
+    def choose_document(self):
+        pdf_path, _ = QFileDialog.getOpenFileName(self, "打开文档", os.getcwd(), "PDF (*.pdf)")
+        if pdf_path:
+            try:
+                self.open_document(pdf_path)
+            except Exception as e:
+                # 文件损坏或无法读取时继续显示当前文档
+                self.statusBar().showMessage(f"无法打开 {os.path.basename(pdf_path)}：{e}")
+
+    def open_document(self, pdf_path):
+        # 先登记并读出新文档的文本，成功后才关闭当前文档；失败时抛出异常，当前文档不受影响
+        overrides = BUNDLED_BOOK if os.path.abspath(pdf_path) == os.path.abspath(FILE_PATH) else {}
+        document = self.registry.register(pdf_path, **overrides)
+        if self.document is not None and self.document.key == document.key:
+            return
+        seed_text_path = PROCESSED_TEXT_PATH if overrides else None
+        document_text = DocumentText(document, seed_text_path=seed_text_path)
+        self.cancel_chat(wait=True)
+        self.finish_reply()
+        if self.lazy_preprocessor is not None:
+            self.lazy_preprocessor.close()
+            self.lazy_preprocessor = None
+        if self.page_renders is not None:
+            self.page_renders.close()
+        if self.chat_log is not None:
+            self.chat_log.close()
+        if self.document_text is not None:
+            self.document_text.close()
+        stale_documents = self.page_documents
+        self.page_documents = OrderedDict()
+        self.document = document
+        self.document_text = document_text
+        self.page_contexts = PageContextCache(self.document_text)
+        self.page_renders = PageRenderCache(self.document_text, on_ready=self.render_signals.page_ready.emit)
+        if LAZY_PREPROCESS:
+            self.lazy_preprocessor = LazyPreprocessor(self.document_text, self.language_unit, document.journal_path,
+                                                      on_update=self.render_signals.page_updated.emit)
+        self.book_index = None
+        # 对话记录按书保存，打开时只读最后一页
+        stale_chat_model = self.chat_model
+        self.chat_log = ChatLog(document.chat_log_path)
+        self.chat_model = ChatListModel(self.chat_log, self)
+        self.chat_view.setModel(self.chat_model)
+        self.chat_view.scrollToBottom()
+        if stale_chat_model is not None:
+            stale_chat_model.deleteLater()
+        self.language_unit.set_document(document.title, document.author)
+        self.setWindowTitle(document.title)
+        self.build_chapter_menu()
+        self.current_page = document.first_page
         self.show_page(self.current_page)
-        self.has_LLM_read_this_path = False
+        for documents in stale_documents.values():
+            for stale_document in documents.values():
+                stale_document.deleteLater()
+
+    def build_chapter_menu(self):
+        while self.chapter_menu_layout.count():
+            self.chapter_menu_layout.takeAt(0).widget().deleteLater()
+        for chapter_index, (chapter_title, page_index) in enumerate(self.document.chapters):
+            button = self.create_menu_button(chapter_index + 1, chapter_title, page_index)
+            self.chapter_menu_layout.addWidget(button, chapter_index // MENU_COLUMNS, chapter_index % MENU_COLUMNS)
 
     def create_menu_button(self, chapter_index, chapter_title, page_index):
         button = QPushButton(f" {chapter_index}-{chapter_title}", self)
         button.clicked.connect(partial(self.go_to_page, page_index))
         button.setFixedHeight(30)
-        button.setFixedWidth(int(TEXT_DISPLAY_WIDTH / 4 - 10))
+        button.setFixedWidth(int(TEXT_DISPLAY_WIDTH / MENU_COLUMNS - 10))
         button.setStyleSheet("text-align: left;")
         return button
 
@@ -327,6 +592,9 @@ class PDFViewer(QMainWindow):
             self.show_page(page_index)
 
     def eventFilter(self, obj, event):
+        if event.type() == QEvent.Type.Paint and obj is self.english_text_display.viewport():
+            obj.removeEventFilter(self)
+            self.on_first_paint()
         if event.type() == QEvent.Type.KeyPress and obj is self.chat_input:
             if event.key() == Qt.Key.Key_Return and self.chat_input.hasFocus():
                 self.chat()
@@ -335,89 +603,257 @@ class PDFViewer(QMainWindow):
     def set_page_number_label(self):
         self.page_number_label.setText(f"原书第 {self.current_page + 1} 页")
 
+    def on_chat_button_clicked(self):
+        if self.chat_worker is not None:
+            self.cancel_chat()
+        else:
+            self.chat()
+
     def chat(self):
         message = self.chat_input.toPlainText().strip()
-        if message:
-            self.chat_display.append(f'<span style="font-size: 16px;color: red;">你</span>: '
-                                     f'<span style="font-size: 16px;color: black;">{message}</span>')
-            self.send_page_content_to_llm()
-            reply = self.language_unit.chat(message, RESPONSE_LENGTH)
-            self.chat_display.append(f'<span style="font-size: 16px;color: blue;">AI</span>: '
-                                     f'<span style="font-size: 16px;color: black;">{reply}</span>')
+        if message and self.chat_worker is None and self.language_unit.model_ready.is_set():
+            self.chat_model.append("user", message)
+            self.reply_id = self.chat_model.append("assistant", "")
+            self.chat_view.scrollToBottom()
             self.chat_input.clear()
-
-    def send_page_content_to_llm(self):
-        if not self.has_LLM_read_this_path:
-            text = "The content on the book page you are currently reading is "
-            for paragraph in self.document_text.paragraphs[self.current_page]:
-                text += "\n" + paragraph
-                self.language_unit.chat(text, RESPONSE_LENGTH)
-            self.has_LLM_read_this_path = True
-
+            use_book_search = self.book_search_checkbox.isChecked()
+            self.language_unit.set_page_context(self.page_contexts.get(self.current_page))
+
+            def prepare(cancel_event):
+                if use_book_search and not cancel_event.is_set():
+                    passages = self.get_book_index().search(message, RETRIEVAL_TOP_K)
+                    compressed = self.language_unit.compress_context([passage["English"] for passage in passages],
+                                                                     RETRIEVAL_CONTEXT_TOKENS, query=message)
+                    passages = [dict(passage, English=english) for passage, english in zip(passages, compressed)
+                                if english]
+                    if passages:
+                        from retrieval import format_passages
+                        return format_passages(passages)
+                return None
+
+            self.chat_worker = ChatWorker(self.language_unit, message, prepare, self)
+            self.chat_worker.token_received.connect(self.append_reply_text)
+            self.chat_worker.first_token.connect(
+                lambda seconds: self.statusBar().showMessage(f"首字延迟 {seconds:.2f} 秒"))
+            self.chat_worker.completed.connect(self.on_chat_completed)
+            self.chat_worker.cancelled.connect(self.on_chat_cancelled)
+            self.chat_worker.failed.connect(self.on_chat_failed)
+            self.chat_worker.finished.connect(self.on_chat_finished)
+            self.chat_input_button.setText(STOP_BUTTON_TEXT)
+            self.chat_worker.start()
+
+    def cancel_chat(self, wait=False):
+        if self.chat_worker is not None:
+            self.chat_worker.cancel()
+            if wait:
+                self.chat_worker.wait()
+
+    def at_chat_bottom(self):
+        scroll_bar = self.chat_view.verticalScrollBar()
+        return scroll_bar.value() >= scroll_bar.maximum() - 4
+
+    def relayout_chat(self):
+        # QListView 在列表模式下不会因 dataChanged 重新计算行高，变长的回复需要重新布局
+        at_bottom = self.at_chat_bottom()
+        self.chat_view.doItemsLayout()
+        if at_bottom:
+            self.chat_view.scrollToBottom()
+
+    def on_chat_scrolled(self, value):
+        # 滚到顶部时再往前读一页，并保持原来顶部那条消息的位置
+        if value == self.chat_view.verticalScrollBar().minimum() and self.chat_model is not None:
+            loaded = self.chat_model.load_older()
+            if loaded:
+                self.chat_view.scrollTo(self.chat_model.index(loaded), QListView.ScrollHint.PositionAtTop)
+
+    def append_reply_text(self, text):
+        if self.reply_id is not None:
+            self.chat_model.append_text(self.reply_id, text)
+            if not self.chat_layout_timer.isActive():
+                self.chat_layout_timer.start()
+
+    def append_chat_status(self, text):
+        # 切换文档或关闭窗口后，旧请求迟到的状态不写进新的对话记录
+        if self.reply_id is not None:
+            self.chat_model.append("status", text)
+            self.chat_view.scrollToBottom()
+
+    def finish_reply(self):
+        if self.reply_id is not None:
+            self.chat_model.save(self.reply_id)
+            self.reply_id = None
+            self.relayout_chat()
+
+    def on_chat_completed(self, first_token_seconds, total_seconds):
+        self.append_chat_status(f"首字 {first_token_seconds:.2f} 秒，共 {total_seconds:.2f} 秒")
+
+    def on_chat_cancelled(self):
+        self.append_chat_status("（已停止）")
+
+    def on_chat_failed(self, error):
+        self.append_chat_status(f"（请求失败：{error}）")
+
+    def on_chat_finished(self):
+        self.finish_reply()
+        self.chat_worker.deleteLater()
+        self.chat_worker = None
+        self.chat_input_button.setText(SEND_BUTTON_TEXT)
+
+    def export_metrics(self):
+        tracer.export_jsonl(METRICS_JSONL_PATH)
+        tracer.export_prometheus(METRICS_PROMETHEUS_PATH)
+
+    def closeEvent(self, event):
+        self.cancel_chat(wait=True)
+        self.finish_reply()
+        self.stats_panel.close()
+        if EXPORT_METRICS:
+            self.export_metrics()
+        if self.lazy_preprocessor is not None:
+            self.lazy_preprocessor.close()
+            self.lazy_preprocessor = None
+        if self.page_renders is not None:
+            self.page_renders.close()
+        if self.chat_log is not None:
+            self.chat_log.close()
+            self.chat_log = None
+        super().closeEvent(event)
+
+    def get_book_index(self):
+        from retrieval import BookIndex
+        from embedding_cache import EmbeddingCache
+
+        if self.book_index is None:
+            embed_fn = None
+            embedding_cache = None
+            if USE_DENSE_RETRIEVAL:
+                embed_fn = self.language_unit.llm.embed
+                embedding_cache = EmbeddingCache(self.document.embedding_cache_dir, EMBEDDING_MODEL)
+            self.book_index = BookIndex(self.document_text.paragraphs, self.document_text.translated_paragraphs,
+                                        embed_fn=embed_fn, embedding_cache=embedding_cache)
+        return self.book_index
+
+    @traced("viewer.show_page")
     def show_page(self, page_index):
-        self.has_LLM_read_this_path = False
+        # 四个视图直接换上预先排好的 QTextDocument；没有预渲染的页面现场生成
+        start = time.perf_counter()
         self.set_page_number_label()
-        english_paragraphs = self.document_text.paragraphs[page_index]
-        chinese_paragraphs = self.document_text.translated_paragraphs[page_index]
-
-        self.english_text_display.clear()
-        english_cursor = QTextCursor(self.english_text_display.document())
-        for block in english_paragraphs:
-            english_cursor.movePosition(QTextCursor.MoveOperation.End)
-            english_cursor.insertText(block, ENGLISH_FORMAT)
-            self.english_text_display.append("\n")
-
-        self.chinese_text_display.clear()
-        chinese_cursor = QTextCursor(self.chinese_text_display.document())
-        for block in chinese_paragraphs:
-            chinese_cursor.movePosition(QTextCursor.MoveOperation.End)
-            chinese_cursor.insertText(block, CHINESE_FORMAT)
-            self.chinese_text_display.append("\n")
-
-        self.compare_text_display.clear()
-        compare_cursor = QTextCursor(self.compare_text_display.document())
-        for english_block, chinese_block in zip(english_paragraphs, chinese_paragraphs):
-            compare_cursor.movePosition(QTextCursor.MoveOperation.End)
-            compare_cursor.insertText(english_block, ENGLISH_FORMAT)
-            self.compare_text_display.append("\n")
-            compare_cursor.movePosition(QTextCursor.MoveOperation.End)
-            compare_cursor.insertText(chinese_block, CHINESE_FORMAT)
-            self.compare_text_display.append(f'<span style="font-size: 17px;color: #00cc00;">{"=" * 69}</span>')
-
-        summary_cursor = QTextCursor(self.summary_text_display.document())
-        summary_cursor.movePosition(QTextCursor.MoveOperation.End)
-        self.summary_text_display.clear()
-        summary_cursor.insertText(self.document_text.page_summary_200[page_index], SUMMARY_FORMAT)
+        documents = self.page_documents.get(page_index)
+        prefetched = documents is not None
+        if documents is None:
+            documents = self.build_page_documents(page_index)
+        self.page_documents.move_to_end(page_index)
+        for view, text_display in self.page_views.items():
+            text_display.setDocument(documents[view])
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        annotate(page_index=page_index, prefetched=prefetched)
+        self.render_stats.append({"page_index": page_index, "render_ms": elapsed_ms, "prefetched": prefetched})
+        self.statusBar().showMessage(f"第 {page_index + 1} 页渲染 {elapsed_ms:.1f} 毫秒"
+                                     f"（{'预渲染' if prefetched else '现场渲染'}）")
+        self.page_renders.prefetch(self.neighbour_pages(page_index))
+        if self.lazy_preprocessor is not None:
+            self.lazy_preprocessor.focus(page_index, self.following_pages(page_index, WARM_PAGES))
+
+    def following_pages(self, page_index, count):
+        pages = []
+        while len(pages) < count and page_index < self.document.last_page:
+            page_index += 1
+            if not self.document_text.is_empty_page(page_index):
+                pages.append(page_index)
+        return pages
+
+    def on_page_updated(self, page_index, done, total):
+        self.invalidate_page(page_index)
+        if page_index == self.current_page:
+            if done < total:
+                progress = f"已翻译 {done}/{total} 段"
+            elif self.document_text.page_summary_200[page_index]:
+                progress = "翻译与总结完成"
+            else:
+                progress = "翻译完成，正在总结"
+            self.statusBar().showMessage(f"第 {page_index + 1} 页{progress}")
+
+    def neighbour_pages(self, page_index):
+        first_page = max(self.document.first_page, page_index - PREFETCH_RADIUS)
+        last_page = min(self.document.last_page, page_index + PREFETCH_RADIUS)
+        # 先预取后一页，顺序翻页最常见
+        return sorted(range(first_page, last_page + 1), key=lambda index: (abs(index - page_index), index < page_index))
+
+    def build_page_documents(self, page_index, page_html=None):
+        if page_html is None:
+            page_html, _ = self.page_renders.get(page_index)
+        documents = {}
+        for view in VIEWS:
+            document = QTextDocument(self)
+            document.setHtml(page_html[view])
+            documents[view] = document
+        self.page_documents[page_index] = documents
+        while len(self.page_documents) > RENDER_CACHE_SIZE:
+            _, evicted = self.page_documents.popitem(last=False)
+            for document in evicted.values():
+                document.deleteLater()
+        return documents
+
+    def on_page_rendered(self, page_index):
+        # 后台渲染好 HTML 后，在 UI 线程空闲时把它排成 QTextDocument，翻到这页时直接换上
+        if page_index in self.page_documents or abs(page_index - self.current_page) > PREFETCH_RADIUS:
+            return
+        page_html, _ = self.page_renders.get(page_index)
+        self.build_page_documents(page_index, page_html)
+        # 保持当前页在 LRU 的最新位置
+        if self.current_page in self.page_documents:
+            self.page_documents.move_to_end(self.current_page)
+
+    def invalidate_page(self, page_index=None):
+        # 页面的译文或总结更新后调用；当前页立即重新显示
+        self.page_renders.invalidate(page_index)
+        self.page_contexts.invalidate(page_index)
+        stale_pages = list(self.page_documents) if page_index is None else [page_index]
+        for stale_page in stale_pages:
+            documents = self.page_documents.pop(stale_page, None)
+            if documents is None:
+                continue
+            if stale_page == self.current_page:
+                self.show_page(stale_page)
+            for document in documents.values():
+                document.deleteLater()
 
     def show_first_page(self):
-        if self.current_page != FIRST_PAGE:
-            self.current_page = FIRST_PAGE
+        if self.current_page != self.document.first_page:
+            self.current_page = self.document.first_page
             self.show_page(self.current_page)
 
     def show_prev_page(self):
-        if self.current_page > FIRST_PAGE:
+        first_page = self.document.first_page
+        if self.current_page > first_page:
             self.current_page -= 1
-            while self.document_text.is_empty_page(self.current_page) and self.current_page > FIRST_PAGE:
+            while self.document_text.is_empty_page(self.current_page) and self.current_page > first_page:
                 self.current_page -= 1
             self.show_page(self.current_page)
 
     def show_next_page(self):
-        if self.current_page < LAST_PAGE:
+        last_page = self.document.last_page
+        if self.current_page < last_page:
             self.current_page += 1
-            while self.document_text.is_empty_page(self.current_page) and self.current_page < LAST_PAGE:
+            while self.document_text.is_empty_page(self.current_page) and self.current_page < last_page:
                 self.current_page += 1
             self.show_page(self.current_page)
 
     def show_last_page(self):
-        if self.current_page != LAST_PAGE:
-            self.current_page = LAST_PAGE
+        if self.current_page != self.document.last_page:
+            self.current_page = self.document.last_page
             self.show_page(self.current_page)
 
 
 if __name__ == "__main__":
-    print_gpu_info()
-    model_name = get_recommended_llm()
-    app = QApplication(sys.argv)
-    viewer = PDFViewer(model_name=model_name)
+    parser = argparse.ArgumentParser(description="AI 阅读器")
+    parser.add_argument("pdf_path", nargs="?", default=FILE_PATH)
+    parser.add_argument("--model", default=None, help="指定聊天模型，默认按实测速度自动选择")
+    parser.add_argument("--exit-after-first-paint", action="store_true", help="显示出第一页后退出，用于测量冷启动")
+    args = parser.parse_args()
+    app = QApplication(sys.argv[:1])
+    viewer = PDFViewer(model_name=args.model, pdf_path=args.pdf_path)
+    if args.exit_after_first_paint:
+        viewer.first_painted.connect(lambda elapsed_ms: QTimer.singleShot(0, viewer.close))
     viewer.show()
     sys.exit(app.exec())
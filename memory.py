@@ -0,0 +1,106 @@
+import threading
+
+from utils import estimate_tokens
+
+# 每条消息除正文外的模板开销（角色标记等）
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+def message_tokens(message):
+    return estimate_tokens(message['content']) + MESSAGE_OVERHEAD_TOKENS
+
+
+class ConversationMemory:
+    # 有 token 预算的对话记忆：
+    # - 发送给模型的始终是 system 提示 + 历史摘要 + 最近的若干轮对话
+    # - 超出预算时从最早的对话开始淘汰，一次淘汰到预算的 low_watermark 比例以下，避免每轮都触发摘要
+    # - 被淘汰的对话先暂存，下次提问前由 update_digest 交给 digest_fn 合并进滚动摘要，早先谈到的内容不会完全丢失；
+    #   摘要请求不在回复的路径上，回复结束后界面立即可用
+    # - page_context（当前页的内容）紧跟在 system 提示之后，同一页上连续提问时整个前缀保持不变
+    # - 聊天线程和界面线程都会访问，读写都在 lock 下进行
+    def __init__(self, system_prompt, token_budget, digest_fn=None, min_recent_turns=2, low_watermark=0.75):
+        self.system_prompt = system_prompt
+        self.token_budget = token_budget
+        self.digest_fn = digest_fn
+        self.min_recent_turns = min_recent_turns
+        self.low_watermark = low_watermark
+        self.page_context = ""
+        self.digest = ""
+        self.turns = []
+        # 已淘汰、还没并入摘要的对话
+        self.evicted = []
+        # clear() 时加一，丢弃换书前发出的摘要请求的结果
+        self.generation = 0
+        self.last_prompt_tokens = 0
+        self.lock = threading.RLock()
+
+    def messages(self):
+        with self.lock:
+            messages = [{'role': 'system', 'content': self.system_prompt}]
+            if self.page_context:
+                messages.append({'role': 'system', 'content': self.page_context})
+            if self.digest:
+                messages.append({'role': 'system', 'content': "Summary of the earlier conversation: " + self.digest})
+            return messages + list(self.turns)
+
+    def prompt_tokens(self, extra_text=""):
+        tokens = sum(message_tokens(message) for message in self.messages())
+        if extra_text:
+            tokens += message_tokens({'content': extra_text})
+        return tokens
+
+    def record_prompt(self, input_text):
+        with self.lock:
+            self.last_prompt_tokens = self.prompt_tokens(input_text)
+            return self.last_prompt_tokens
+
+    def add_exchange(self, user_text, assistant_text):
+        with self.lock:
+            self.turns.append({'role': 'user', 'content': user_text})
+            self.turns.append({'role': 'assistant', 'content': assistant_text})
+            if self.prompt_tokens() > self.token_budget:
+                self.evict()
+
+    def evict(self):
+        evicted = []
+        target = self.token_budget * self.low_watermark
+        with self.lock:
+            while len(self.turns) > self.min_recent_turns and self.prompt_tokens() > target:
+                evicted.append(self.turns.pop(0))
+            # 不让 assistant 的回复成为窗口里的第一条消息
+            while len(self.turns) > self.min_recent_turns and self.turns[0]['role'] != 'user':
+                evicted.append(self.turns.pop(0))
+            self.evicted += evicted
+        return evicted
+
+    def update_digest(self):
+        # 把暂存的被淘汰对话并入摘要（一次 LLM 请求）。请求期间不持有锁，界面线程换页、换书不会被阻塞
+        with self.lock:
+            evicted, self.evicted = self.evicted, []
+            digest, generation = self.digest, self.generation
+        if not evicted or self.digest_fn is None:
+            return
+        try:
+            digest = self.digest_fn(digest, evicted)
+        except Exception:
+            with self.lock:
+                if self.generation == generation:
+                    self.evicted[:0] = evicted
+            raise
+        with self.lock:
+            if self.generation == generation:
+                self.digest = digest
+
+    def set_page_context(self, page_context):
+        with self.lock:
+            self.page_context = page_context
+
+    def clear(self, system_prompt=None):
+        with self.lock:
+            if system_prompt is not None:
+                self.system_prompt = system_prompt
+            self.page_context = ""
+            self.digest = ""
+            self.turns = []
+            self.evicted = []
+            self.generation += 1
@@ -0,0 +1,119 @@
+import json
+import os
+import time
+
+from utils import get_recommended_llm
+
+CALIBRATION_PATH = "model_calibration.json"
+CALIBRATION_PROMPT = "Summarize in two sentences why reading a book slowly can help understanding."
+CALIBRATION_TOKENS = 64
+# 聊天：首字延迟和生成速度的要求；预处理：生成速度的目标
+CHAT_TTFT_SLO_MS = 1500
+CHAT_MIN_TOKENS_PER_SECOND = 15
+BATCH_MIN_TOKENS_PER_SECOND = 30
+
+
+def local_name(model_name):
+    return model_name if ":" in model_name else model_name + ":latest"
+
+
+def local_models(client):
+    # 本地已有的模型：名称 -> {digest, size}
+    return {model['model']: {"digest": model['digest'], "size": model['size']} for model in client.list()['models']}
+
+
+def ensure_model(client, model_name):
+    # 本地已有该模型时不再 pull，启动时省去一次与模型仓库的往返
+    if local_name(model_name) in local_models(client):
+        return
+    last_status = None
+    for progress in client.pull(model_name, stream=True):
+        if progress["status"] != last_status:
+            last_status = progress["status"]
+            print(f"ollama pull {model_name}: {last_status}")
+
+
+def calibrate(client, model_name):
+    # 第一次请求包含模型加载，记录加载耗时；第二次请求模型已在显存中，记录 prefill 与生成速度
+    options = {"num_predict": CALIBRATION_TOKENS, "temperature": 0}
+    messages = [{'role': 'user', 'content': CALIBRATION_PROMPT}]
+    start = time.perf_counter()
+    cold = client.chat(model=model_name, messages=messages, options=options)
+    cold_ms = (time.perf_counter() - start) * 1000
+    warm = client.chat(model=model_name, messages=messages, options=options)
+    eval_seconds = (warm['eval_duration'] or 0) / 1e9
+    prompt_ms = (warm['prompt_eval_duration'] or 0) / 1e6
+    tokens_per_second = (warm['eval_count'] or 0) / eval_seconds if eval_seconds else 0.0
+    return {
+        "load_ms": (cold['load_duration'] or 0) / 1e6,
+        "cold_ms": cold_ms,
+        "prompt_ms": prompt_ms,
+        "tokens_per_second": tokens_per_second,
+        # 模型已加载时，首字延迟约为 prefill 加上生成一个 token 的时间
+        "ttft_ms": prompt_ms + (1000 / tokens_per_second if tokens_per_second else 0.0),
+    }
+
+
+class ModelSelector:
+    # 按实测速度选择模型：对 candidates 中本地已有的模型各跑一次简短的校准请求，
+    # 结果按 (服务地址, 模型, digest) 缓存在 CALIBRATION_PATH，模型更新后才重新测量。
+    # 更大的模型视为质量更好：聊天选满足延迟要求的最大模型，预处理选满足吞吐目标的最大模型。
+    def __init__(self, candidates, host=None, path=CALIBRATION_PATH):
+        self.candidates = candidates
+        self.host = host
+        self.path = path
+        import ollama
+        self.client = ollama.Client(host=host)
+        self.results = {}
+        if os.path.exists(path):
+            with open(path, "r") as f:
+                self.results = json.load(f)
+
+    def save(self):
+        temporary_path = self.path + ".tmp"
+        with open(temporary_path, "w") as f:
+            json.dump(self.results, f, indent=1)
+        os.replace(temporary_path, self.path)
+
+    def measurements(self):
+        # 返回 [(模型名, 模型大小, 测量结果)]，只包含本地已有的候选模型
+        available = local_models(self.client)
+        measured = []
+        for model_name in self.candidates:
+            model = available.get(local_name(model_name))
+            if model is None:
+                continue
+            key = f"{self.host or 'local'}|{model_name}|{model['digest']}"
+            if key not in self.results:
+                print(f"calibrating {model_name} ...")
+                self.results[key] = calibrate(self.client, model_name)
+                self.save()
+            measured.append((model_name, model["size"], self.results[key]))
+        return measured
+
+    def choose(self, acceptable):
+        measured = self.measurements()
+        if not measured:
+            # 候选模型一个都没有下载过时，退回按显存大小推荐
+            return get_recommended_llm()
+        passing = [item for item in measured if acceptable(item[2])]
+        if passing:
+            return max(passing, key=lambda item: item[1])[0]
+        return max(measured, key=lambda item: item[2]["tokens_per_second"])[0]
+
+    def chat_model(self):
+        return self.choose(lambda result: result["ttft_ms"] <= CHAT_TTFT_SLO_MS
+                           and result["tokens_per_second"] >= CHAT_MIN_TOKENS_PER_SECOND)
+
+    def batch_model(self):
+        return self.choose(lambda result: result["tokens_per_second"] >= BATCH_MIN_TOKENS_PER_SECOND)
+
+
+if __name__ == "__main__":
+    from llm import MODEL_CARDS
+
+    selector = ModelSelector(MODEL_CARDS)
+    print(f"{'model':>24} {'load ms':>9} {'ttft ms':>9} {'tok/s':>8}")
+    for name, _, result in selector.measurements():
+        print(f"{name:>24} {result['load_ms']:>9.0f} {result['ttft_ms']:>9.0f} {result['tokens_per_second']:>8.1f}")
+    print(f"chat: {selector.chat_model()}, preprocess: {selector.batch_model()}")
@@ -0,0 +1,56 @@
+from collections import OrderedDict
+
+from utils import estimate_tokens
+
+# 当前页上下文的 token 上限，需与对话记忆共用 CHAT_TOKEN_BUDGET
+PAGE_CONTEXT_TOKENS = 600
+PAGE_CONTEXT_CACHE_SIZE = 16
+PAGE_SUMMARY_LENGTHS = (300, 200, 100)
+
+
+class PageContextCache:
+    # 把“当前正在读的页”整理成一段紧凑的文本，作为对话的一条 system 消息只发送一次：
+    # - 原文放得下就用原文，否则用预处理好的页面总结中放得下的最长那份，都没有时按与全页质心的相似度抽取句子
+    # - 同一页上连续提问时前缀逐字节相同，Ollama 可以复用上一次请求的 KV 缓存，只对新的提问做 prefill
+    # - 最近访问过的页面的文本保存在 LRU 里，省去的只是重新整理（抽取句子）的开销：Ollama 每个槽位只保留
+    #   最近一次请求的 KV，翻到别的页再回来时这一页的前缀仍要重新 prefill
+    def __init__(self, document_text, token_budget=PAGE_CONTEXT_TOKENS, cache_size=PAGE_CONTEXT_CACHE_SIZE):
+        self.document_text = document_text
+        self.token_budget = token_budget
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+
+    def get(self, page_index):
+        text = self.cache.get(page_index)
+        if text is None:
+            text = self.build(page_index)
+            self.cache[page_index] = text
+            if len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+        else:
+            self.cache.move_to_end(page_index)
+        return text
+
+    def invalidate(self, page_index=None):
+        # 页面的译文或总结更新后调用
+        if page_index is None:
+            self.cache.clear()
+        else:
+            self.cache.pop(page_index, None)
+
+    def build(self, page_index):
+        header = f"The content on the book page {page_index + 1} you are currently reading is:"
+        budget = self.token_budget - estimate_tokens(header)
+        paragraphs = self.document_text.paragraphs[page_index]
+        body = "\n".join(paragraphs)
+        if estimate_tokens(body) <= budget:
+            return header + "\n" + body
+        for summary_length in PAGE_SUMMARY_LENGTHS:
+            summary = getattr(self.document_text, f"page_summary_{summary_length}")[page_index]
+            if summary and estimate_tokens(summary) <= budget:
+                return f"A summary of the book page {page_index + 1} you are currently reading:\n" + summary
+        # 与提问无关，同一页每次抽取的结果相同，在这一页上连续提问时前缀不变
+        from compression import compress
+
+        kept = [paragraph for paragraph in compress(paragraphs, budget) if paragraph]
+        return header + "\n" + "\n".join(kept)
@@ -0,0 +1,103 @@
+import html
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+# 以当前页为中心预渲染前后各 PREFETCH_RADIUS 页
+PREFETCH_RADIUS = 2
+RENDER_CACHE_SIZE = 16
+VIEWS = ("english", "chinese", "compare", "summary")
+ENGLISH_STYLE = "font-family: Georgia; font-size: 14pt;"
+CHINESE_STYLE = "font-family: SimHei; font-size: 15pt;"
+SUMMARY_STYLE = "font-family: SimHei; font-size: 12pt;"
+BLANK_LINE = "<p><br></p>"
+SEPARATOR = f'<p><span style="font-size: 17px;color: #00cc00;">{"=" * 69}</span></p>'
+
+
+def paragraph_html(text, style):
+    return f'<p style="{style}">{html.escape(text)}</p>'
+
+
+def render_page(english_paragraphs, chinese_paragraphs, summary):
+    # 返回 {视图名: HTML}，与原先逐段 insertText + append 的排版一致：段落之间空一行，对照视图用分隔线隔开
+    english = "".join(paragraph_html(block, ENGLISH_STYLE) + BLANK_LINE for block in english_paragraphs)
+    chinese = "".join(paragraph_html(block, CHINESE_STYLE) + BLANK_LINE for block in chinese_paragraphs)
+    compare = "".join(paragraph_html(english_block, ENGLISH_STYLE) + BLANK_LINE +
+                      paragraph_html(chinese_block, CHINESE_STYLE) + SEPARATOR
+                      for english_block, chinese_block in zip(english_paragraphs, chinese_paragraphs))
+    return {"english": english, "chinese": chinese, "compare": compare,
+            "summary": paragraph_html(summary, SUMMARY_STYLE) if summary else ""}
+
+
+class PageRenderCache:
+    # 页面 HTML 的 LRU，在后台线程里提前渲染当前页附近的页面。
+    # 这里不涉及任何 Qt 对象，可以安全地离开 UI 线程运行；on_ready(page_index) 在后台线程里调用。
+    def __init__(self, document_text, cache_size=RENDER_CACHE_SIZE, on_ready=None):
+        self.document_text = document_text
+        self.cache_size = cache_size
+        self.on_ready = on_ready
+        self.cache = OrderedDict()
+        self.pending = set()
+        # 页面内容更新后版本号加一，更新前就已开始的后台渲染结果会被丢弃
+        self.versions = {}
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=1)
+
+    def render(self, page_index):
+        return render_page(self.document_text.paragraphs[page_index],
+                           self.document_text.translated_paragraphs[page_index],
+                           self.document_text.page_summary_200[page_index])
+
+    def store(self, page_index, page_html):
+        with self.lock:
+            self.cache[page_index] = page_html
+            self.cache.move_to_end(page_index)
+            if len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+
+    def get(self, page_index):
+        # 返回 (HTML, 是否命中缓存)；未命中时在当前线程同步渲染
+        with self.lock:
+            page_html = self.cache.get(page_index)
+            if page_html is not None:
+                self.cache.move_to_end(page_index)
+                return page_html, True
+        page_html = self.render(page_index)
+        self.store(page_index, page_html)
+        return page_html, False
+
+    def prefetch(self, page_indices):
+        for page_index in page_indices:
+            with self.lock:
+                if page_index in self.cache or page_index in self.pending:
+                    continue
+                self.pending.add(page_index)
+                version = self.versions.get(page_index, 0)
+            self.executor.submit(self.prefetch_page, page_index, version)
+
+    def prefetch_page(self, page_index, version):
+        try:
+            page_html = self.render(page_index)
+            with self.lock:
+                if self.versions.get(page_index, 0) != version:
+                    return
+            self.store(page_index, page_html)
+        finally:
+            with self.lock:
+                self.pending.discard(page_index)
+        if self.on_ready is not None:
+            self.on_ready(page_index)
+
+    def invalidate(self, page_index=None):
+        with self.lock:
+            if page_index is None:
+                self.cache.clear()
+                for index in set(self.versions) | self.pending:
+                    self.versions[index] = self.versions.get(index, 0) + 1
+            else:
+                self.cache.pop(page_index, None)
+                self.versions[page_index] = self.versions.get(page_index, 0) + 1
+
+    def close(self):
+        # 等正在进行的渲染结束，之后才能安全地关闭页面存储
+        self.executor.shutdown(wait=True, cancel_futures=True)
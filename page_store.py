@@ -0,0 +1,158 @@
+import json
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+
+# 列名 -> processed_texts.json 中对应的键
+FIELDS = {
+    "english": "English",
+    "chinese": "Chinese",
+    "summary_100": "100-word summary",
+    "summary_200": "200-word summary",
+    "summary_300": "300-word summary",
+}
+LIST_FIELDS = ("english", "chinese")
+PAGE_CACHE_SIZE = 32
+
+
+class PageStore:
+    # 按页寻址的 SQLite 存储：每页一行，打开时不读取任何页面内容，
+    # 页面在第一次访问时才解码，并放入容量为 cache_size 的 LRU。
+    # 每次写入只更新一页，在单个事务中完成，进程崩溃不会破坏其他页面。
+    def __init__(self, path, cache_size=PAGE_CACHE_SIZE):
+        self.path = path
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+        # 预处理和后台翻译会在工作线程里写入
+        self.lock = threading.RLock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        columns = ", ".join(f"{field} TEXT NOT NULL DEFAULT ''" for field in FIELDS)
+        with self.connection:
+            self.connection.execute(f"CREATE TABLE IF NOT EXISTS pages (page_index INTEGER PRIMARY KEY, {columns})")
+
+    def page_count(self):
+        with self.lock:
+            row = self.connection.execute("SELECT MAX(page_index) FROM pages").fetchone()
+        return 0 if row[0] is None else row[0] + 1
+
+    @staticmethod
+    def decode(field, value):
+        if field in LIST_FIELDS:
+            return json.loads(value) if value else []
+        return value
+
+    @staticmethod
+    def encode(field, value):
+        if field in LIST_FIELDS:
+            return json.dumps(value, ensure_ascii=False)
+        return value
+
+    def get_page(self, page_index):
+        with self.lock:
+            page = self.cache.get(page_index)
+            if page is not None:
+                self.cache.move_to_end(page_index)
+                return page
+            row = self.connection.execute(f"SELECT {', '.join(FIELDS)} FROM pages WHERE page_index = ?",
+                                          (page_index,)).fetchone()
+            if row is None:
+                page = {field: self.decode(field, "") for field in FIELDS}
+            else:
+                page = {field: self.decode(field, value) for field, value in zip(FIELDS, row)}
+            self.cache[page_index] = page
+            if len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+            return page
+
+    def update_page(self, page_index, **values):
+        encoded = {field: self.encode(field, value) for field, value in values.items()}
+        assignments = ", ".join(f"{field} = excluded.{field}" for field in encoded)
+        columns = ", ".join(["page_index"] + list(encoded))
+        placeholders = ", ".join("?" * (len(encoded) + 1))
+        with self.lock:
+            with self.connection:
+                self.connection.execute(
+                    f"INSERT INTO pages ({columns}) VALUES ({placeholders}) "
+                    f"ON CONFLICT(page_index) DO UPDATE SET {assignments}",
+                    [page_index] + list(encoded.values()))
+            page = self.cache.get(page_index)
+            if page is not None:
+                page.update({field: list(value) if field in LIST_FIELDS else value
+                             for field, value in values.items()})
+
+    def write_pages(self, pages):
+        # pages: {page_index: {field: value}}，整批在一个事务里写入，用于迁移和首次抽取文本
+        with self.lock:
+            with self.connection:
+                for page_index, values in pages.items():
+                    encoded = {field: self.encode(field, value) for field, value in values.items()}
+                    columns = ", ".join(["page_index"] + list(encoded))
+                    placeholders = ", ".join("?" * (len(encoded) + 1))
+                    self.connection.execute(f"INSERT OR REPLACE INTO pages ({columns}) VALUES ({placeholders})",
+                                            [page_index] + list(encoded.values()))
+            self.cache.clear()
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+
+class PageColumn:
+    # 把 PageStore 的一列包装成按页下标访问的序列，DocumentText 原先使用 list 的代码无需改动
+    def __init__(self, store, field):
+        self.store = store
+        self.field = field
+
+    def __len__(self):
+        return self.store.page_count()
+
+    def __getitem__(self, page_index):
+        if page_index < 0:
+            page_index += len(self)
+        return self.store.get_page(page_index)[self.field]
+
+    def __setitem__(self, page_index, value):
+        self.store.update_page(page_index, **{self.field: value})
+
+    def __iter__(self):
+        for page_index in range(len(self)):
+            yield self[page_index]
+
+
+def migrate_json(json_path, store):
+    with open(json_path, "r") as f:
+        data = json.load(f)
+    page_count = len(data[FIELDS["english"]])
+    pages = {page_index: {field: data[key][page_index] for field, key in FIELDS.items()}
+             for page_index in range(page_count)}
+    store.write_pages(pages)
+    return page_count
+
+
+def export_json(store, json_path):
+    data = {key: list(PageColumn(store, field)) for field, key in FIELDS.items()}
+    # 先写临时文件再替换，写到一半崩溃不会留下损坏的 JSON
+    temporary_path = json_path + ".tmp"
+    with open(temporary_path, "w") as f:
+        json.dump(data, f)
+    os.replace(temporary_path, json_path)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="processed_texts.json 与按页存储的 SQLite 之间互相转换")
+    parser.add_argument("command", choices=["migrate", "export"])
+    parser.add_argument("json_path", nargs="?", default="processed_texts.json")
+    parser.add_argument("store_path", nargs="?", default="processed_texts.db")
+    args = parser.parse_args()
+    page_store = PageStore(args.store_path)
+    if args.command == "migrate":
+        print(f"migrated {migrate_json(args.json_path, page_store)} pages into {args.store_path}")
+    else:
+        export_json(page_store, args.json_path)
+        print(f"exported {page_store.page_count()} pages into {args.json_path}")
+    page_store.close()
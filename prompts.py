@@ -0,0 +1,80 @@
+class PromptTemplate:
+    # 指令放在 system 消息里，且不含任何随调用变化的内容：连续的请求共享同一段前缀，
+    # Ollama 可以直接复用这段前缀的 KV 缓存，只需对新的正文做 prefill。
+    # 随调用变化的部分（正文、字数要求等）都放在 user 消息里。
+    def __init__(self, system, user):
+        self.system = system
+        self.user = user
+
+    def history(self, **kwargs):
+        return [{'role': 'system', 'content': self.system.format(**kwargs)}]
+
+    def render(self, **kwargs):
+        return self.user.format(**kwargs)
+
+
+def join_paragraphs(paragraph_list):
+    text = ""
+    for item in paragraph_list:
+        paragraph = item["paragraph"] if type(item) == dict else item
+        text += "\n " + paragraph
+    return text
+
+
+def book_assistant_prompt(title=None, author=""):
+    if title is None:
+        return "You are an AI assistant to help reader read a book."
+    prompt = f"You are an AI assistant to help reader read the book <<{title}>>"
+    if author:
+        prompt += f" written by {author}"
+    return prompt + "."
+
+
+TRANSLATE_TEMPLATE = PromptTemplate(
+    system=("You are a translator. You will be given a piece of text in English. You are supposed to translate it "
+            "into simplified Chinese. And you must follow the requirements as follows: \n"
+            "1. The translation into simplified Chinese must be easily understood.\n"
+            "2. Only output the translated text. Extra information is unwanted.\n"),
+    user="The text in English is as follows: \n {text}",
+)
+
+TRANSLATE_BATCH_TEMPLATE = PromptTemplate(
+    system=("You are a translator. You will be given numbered segments of text in English, each starting with its "
+            "number in double angle brackets, such as <<1>>. You are supposed to translate every segment into "
+            "simplified Chinese. And you must follow the requirements as follows: \n"
+            "1. The translation into simplified Chinese must be easily understood.\n"
+            "2. Translate each segment separately. Never merge, split or skip segments.\n"
+            "3. Start the translation of each segment with the same number in double angle brackets, in the same "
+            "order.\n"
+            "4. Only output the numbered translations. Extra information is unwanted.\n"),
+    user="The segments in English are as follows:{segments}",
+)
+
+SUMMARIZE_TEMPLATE = PromptTemplate(
+    system=("You will be given a few paragraphs of an article. You are supposed to write a summary of them. "
+            "Your summary must strictly follow the requirements below: \n"
+            "1. The summary must be strictly within the number of words given together with the paragraphs.\n"
+            "2. The language of the summary must be simplified Chinese.\n"
+            "3. The summary must be clear, explicit, easily-understood, fluent and smooth.\n"),
+    user="The summary must be strictly within {summary_length} words. The paragraphs from an article are as follows:"
+         "{paragraphs}",
+)
+
+SUMMARIZE_ALL_TEMPLATE = PromptTemplate(
+    system=("You will be given a few paragraphs of an article. Write summaries of them that strictly follow the "
+            "requirements below: \n"
+            "1. Write one summary for each of the lengths {keys}. The summary under key \"N\" must be strictly "
+            "within N words.\n"
+            "2. The language of the summaries must be simplified Chinese.\n"
+            "3. The summaries must be clear, explicit, easily-understood, fluent and smooth.\n"
+            "4. Output only a JSON object whose keys are {keys} and whose values are the summaries.\n"),
+    user="The paragraphs from an article are as follows:{paragraphs}",
+)
+
+DIGEST_TEMPLATE = PromptTemplate(
+    system=("You maintain a running summary of a conversation between a reader and an AI reading assistant. "
+            "You will be given the current summary and some earlier turns of the conversation. Merge them into "
+            "one updated summary that keeps the questions asked, the facts established and the pages discussed. "
+            "The updated summary must be strictly within {digest_length} words. Only output the summary.\n"),
+    user="The current summary is: \n {digest}\n\nThe earlier turns are as follows:{turns}",
+)
@@ -0,0 +1,127 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+
+RESPONSE_CACHE_MAX_BYTES = 64 * 2 ** 20
+# 超出容量时一次淘汰到容量的这个比例以下
+LOW_WATERMARK = 0.9
+SEMANTIC_THRESHOLD = 0.95
+
+
+def request_key(model_name, messages, options):
+    data = json.dumps({"model": model_name, "messages": messages, "options": options}, ensure_ascii=False,
+                      sort_keys=True, default=str)
+    return hashlib.sha1(data.encode("utf-8")).hexdigest()
+
+
+def semantic_scope(model_name, messages, options, context=None):
+    # 近似匹配只在相同的模型、system 消息（书、当前页、对话摘要）、参数和 context（随提问发送的检索段落、
+    # 回复长度等）下进行，与之前聊过的轮次无关
+    system_messages = [message for message in messages if message['role'] == 'system']
+    return request_key(model_name, {"system": system_messages, "context": context}, options)
+
+
+class ResponseCache:
+    # 持久化的 LLM 回复缓存（SQLite）：
+    # - 精确匹配：以 模型 + 完整消息历史 + 请求参数 的哈希为键
+    # - 近似匹配（可选）：同一 scope 下，用户提问本身（不含检索段落等附加内容）的 embedding 余弦相似度不低于 threshold 时复用回复
+    # - 总大小超过 max_bytes 时按最近使用时间淘汰
+    def __init__(self, path, max_bytes=RESPONSE_CACHE_MAX_BYTES, semantic_threshold=SEMANTIC_THRESHOLD):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.semantic_threshold = semantic_threshold
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        with self.connection:
+            self.connection.execute("CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, response TEXT NOT NULL, "
+                                    "size INTEGER NOT NULL, last_used REAL NOT NULL, scope TEXT, vector BLOB)")
+            self.connection.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)")
+            self.connection.execute("CREATE INDEX IF NOT EXISTS responses_scope ON responses (scope)")
+        self.total_bytes = self.connection.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    def get(self, key):
+        with self.lock:
+            row = self.connection.execute("SELECT response FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.touch(key)
+            self.hits += 1
+            return row[0]
+
+    def get_similar(self, scope, vector):
+        # 返回同一 scope 下最相近的回复；没有足够相近的返回 None（不计入 misses，随后的 get 已计过）
+        import numpy as np
+
+        query = np.array(vector, dtype=np.float32)
+        query /= np.linalg.norm(query) or 1.0
+        with self.lock:
+            rows = self.connection.execute("SELECT key, response, vector FROM responses "
+                                           "WHERE scope = ? AND vector IS NOT NULL", (scope,)).fetchall()
+            if not rows:
+                return None
+            matrix = np.stack([np.frombuffer(row[2], dtype=np.float32) for row in rows])
+            if matrix.shape[1] != query.shape[0]:
+                return None
+            scores = matrix @ query
+            best = int(np.argmax(scores))
+            if scores[best] < self.semantic_threshold:
+                return None
+            self.touch(rows[best][0])
+            self.semantic_hits += 1
+            # 之前的 get 把这次算作了未命中
+            self.misses -= 1
+            return rows[best][1]
+
+    def touch(self, key):
+        with self.connection:
+            self.connection.execute("UPDATE responses SET last_used = ? WHERE key = ?", (time.time(), key))
+
+    def put(self, key, response, scope=None, vector=None):
+        blob = None
+        if vector is not None:
+            import numpy as np
+
+            vector = np.asarray(vector, dtype=np.float32)
+            blob = (vector / (np.linalg.norm(vector) or 1.0)).tobytes()
+        size = len(response.encode("utf-8")) + (len(blob) if blob else 0)
+        with self.lock:
+            with self.connection:
+                old = self.connection.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+                self.connection.execute("INSERT OR REPLACE INTO responses (key, response, size, last_used, scope, "
+                                        "vector) VALUES (?, ?, ?, ?, ?, ?)",
+                                        (key, response, size, time.time(), scope, blob))
+            self.total_bytes += size - (old[0] if old else 0)
+            if self.total_bytes > self.max_bytes:
+                self.evict()
+
+    def evict(self):
+        target = self.max_bytes * LOW_WATERMARK
+        with self.connection:
+            rows = self.connection.execute("SELECT key, size FROM responses ORDER BY last_used").fetchall()
+            evicted = []
+            for key, size in rows:
+                if self.total_bytes <= target:
+                    break
+                evicted.append((key,))
+                self.total_bytes -= size
+            self.connection.executemany("DELETE FROM responses WHERE key = ?", evicted)
+
+    def stats(self):
+        with self.lock:
+            count = self.connection.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        lookups = self.hits + self.semantic_hits + self.misses
+        return {"hits": self.hits, "semantic_hits": self.semantic_hits, "misses": self.misses,
+                "hit_rate": (self.hits + self.semantic_hits) / lookups if lookups else 0.0,
+                "entries": count, "bytes": self.total_bytes}
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
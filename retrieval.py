@@ -0,0 +1,152 @@
+import re
+from collections import Counter
+
+import numpy as np
+
+ENGLISH_STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "but", "by", "for", "from", "has", "have", "in", "is", "it", "its",
+    "of", "on", "or", "that", "the", "this", "to", "was", "were", "will", "with",
+}
+RRF_K = 60
+
+
+def tokenize(text):
+    # 英文按单词切分，中文按相邻两字切分（bigram），不依赖分词库
+    text = text.lower()
+    tokens = [word for word in re.findall(r"[a-z0-9]+", text) if word not in ENGLISH_STOPWORDS]
+    for run in re.findall(r"[一-鿿]+", text):
+        if len(run) == 1:
+            tokens.append(run)
+        else:
+            tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return tokens
+
+
+def top_k(scores, k):
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.array([], dtype=np.int64)
+    candidates = np.argpartition(-scores, k - 1)[:k]
+    return candidates[np.argsort(-scores[candidates], kind="stable")]
+
+
+class BM25Index:
+    # 倒排索引按 CSR 方式存成三个数组；每条倒排记录的 BM25 权重在建索引时就算好，
+    # 查询时每个词只需一次向量化的累加
+    def __init__(self, documents, k1=1.5, b=0.75):
+        self.document_count = len(documents)
+        self.vocabulary = {}
+        term_ids = []
+        doc_ids = []
+        term_frequencies = []
+        document_lengths = np.zeros(self.document_count, dtype=np.float32)
+        for doc_id, text in enumerate(documents):
+            tokens = tokenize(text)
+            document_lengths[doc_id] = len(tokens)
+            for term, count in Counter(tokens).items():
+                term_ids.append(self.vocabulary.setdefault(term, len(self.vocabulary)))
+                doc_ids.append(doc_id)
+                term_frequencies.append(count)
+        term_ids = np.asarray(term_ids, dtype=np.int64)
+        doc_ids = np.asarray(doc_ids, dtype=np.int32)
+        tf = np.asarray(term_frequencies, dtype=np.float32)
+        average_length = float(document_lengths.mean()) if document_lengths.any() else 1.0
+
+        df = np.bincount(term_ids, minlength=len(self.vocabulary)).astype(np.float32)
+        idf = np.log1p((self.document_count - df + 0.5) / (df + 0.5))
+        norm = k1 * (1 - b + b * document_lengths[doc_ids] / average_length)
+        weights = (idf[term_ids] * tf * (k1 + 1) / (tf + norm)).astype(np.float32)
+
+        order = np.argsort(term_ids, kind="stable")
+        self.offsets = np.concatenate([[0], np.cumsum(df, dtype=np.int64)])
+        self.doc_ids = doc_ids[order]
+        self.weights = weights[order]
+
+    def scores(self, query):
+        scores = np.zeros(self.document_count, dtype=np.float32)
+        for term in set(tokenize(query)):
+            term_id = self.vocabulary.get(term)
+            if term_id is None:
+                continue
+            start, end = self.offsets[term_id], self.offsets[term_id + 1]
+            # 同一个词的倒排记录里文档各不相同，可以直接用花式索引累加
+            scores[self.doc_ids[start:end]] += self.weights[start:end]
+        return scores
+
+
+class DenseIndex:
+    # 向量检索：所有段落的 embedding 存成一个归一化的 float32 矩阵，查询就是一次矩阵-向量乘法。
+    # 给定 cache（EmbeddingCache）时向量从磁盘缓存读取，只有新段落才需要请求 Ollama
+    def __init__(self, documents, embed_fn, cache=None, batch_size=64):
+        self.embed_fn = embed_fn
+        if cache is not None:
+            self.matrix = cache.embed(documents, self.embed_normalized, batch_size=batch_size)
+        else:
+            vectors = []
+            for start in range(0, len(documents), batch_size):
+                vectors.extend(self.embed_normalized(documents[start:start + batch_size]))
+            self.matrix = np.asarray(vectors, dtype=np.float32).reshape(len(documents), -1)
+
+    def embed_normalized(self, texts):
+        return self.normalize(np.asarray(self.embed_fn(texts), dtype=np.float32).reshape(len(texts), -1))
+
+    @staticmethod
+    def normalize(matrix):
+        norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+        return matrix / np.maximum(norms, 1e-12)
+
+    def scores(self, query):
+        query_vector = self.normalize(np.asarray(self.embed_fn([query])[0], dtype=np.float32))
+        return self.matrix @ query_vector
+
+
+class BookIndex:
+    # 基于 processed_texts.json 中英文/中文段落的全书检索，检索单位为段落
+    def __init__(self, paragraphs, translated_paragraphs, embed_fn=None, embedding_cache=None):
+        self.locations = []
+        self.english = []
+        self.chinese = []
+        for page_index, page_paragraphs in enumerate(paragraphs):
+            page_translations = translated_paragraphs[page_index] if page_index < len(translated_paragraphs) else []
+            for paragraph_index, paragraph in enumerate(page_paragraphs):
+                self.locations.append((page_index, paragraph_index))
+                self.english.append(paragraph)
+                self.chinese.append(page_translations[paragraph_index]
+                                    if paragraph_index < len(page_translations) else "")
+        self.bm25 = BM25Index([english + " " + chinese for english, chinese in zip(self.english, self.chinese)])
+        self.dense = DenseIndex(self.english, embed_fn, cache=embedding_cache) if embed_fn is not None else None
+
+    def __len__(self):
+        return len(self.locations)
+
+    def search(self, query, k=5):
+        if not self.locations:
+            return []
+        scores = self.bm25.scores(query)
+        if self.dense is not None:
+            # 两路结果用 RRF 融合：按名次而不是分数相加，免去两种分数之间的标定
+            dense_scores = self.dense.scores(query)
+            bm25_ranks = np.empty(len(scores), dtype=np.float32)
+            bm25_ranks[np.argsort(-scores, kind="stable")] = np.arange(len(scores))
+            dense_ranks = np.empty(len(scores), dtype=np.float32)
+            dense_ranks[np.argsort(-dense_scores, kind="stable")] = np.arange(len(scores))
+            scores = np.where(scores > 0, 1 / (RRF_K + bm25_ranks), 0) + 1 / (RRF_K + dense_ranks)
+        results = []
+        for doc_id in top_k(scores, k):
+            if scores[doc_id] <= 0:
+                break
+            page_index, paragraph_index = self.locations[doc_id]
+            results.append({"page index": page_index,
+                            "paragraph index": paragraph_index,
+                            "English": self.english[doc_id],
+                            "Chinese": self.chinese[doc_id],
+                            "score": float(scores[doc_id])})
+        return results
+
+
+def format_passages(passages):
+    # 引用页码与界面上显示的“原书第 N 页”一致
+    text = "Passages from the book that may be relevant to the question (cite the page numbers in your answer):"
+    for passage in passages:
+        text += f"\n[p. {passage['page index'] + 1}] {passage['English']}"
+    return text
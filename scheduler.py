@@ -0,0 +1,77 @@
+import random
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+def is_transient(error):
+    # 连接失败、超时和 Ollama 的 5xx 错误可能过一会儿就好；模型不存在（404）、输出解析失败等重试也没用
+    if isinstance(error, (ConnectionError, TimeoutError)):
+        return True
+    # ollama 客户端底层用 httpx，没有导入过就不可能是它的错误
+    httpx = sys.modules.get("httpx")
+    if httpx is not None and isinstance(error, httpx.TransportError):
+        return True
+    status_code = getattr(error, "status_code", None)
+    return isinstance(status_code, int) and status_code >= 500
+
+
+class LLMScheduler:
+    # 有界并发的 LLM 请求调度器：
+    # - max_workers 个线程同时向 Ollama 发请求，让 GPU 在往返间隙也有活干
+    # - 在途任务数达到 max_pending 时 submit 阻塞（背压），避免一次性堆积整本书的请求
+    # - 暂时性的失败（见 is_transient）按指数退避（带抖动）重试 max_retries 次，其他错误直接抛出；
+    #   shutdown(wait=False) 后不再重试
+    # 结果以 Future 返回，调用方按提交顺序取结果即可得到确定的输出顺序。
+    def __init__(self, max_workers=4, max_pending=None, max_retries=3, base_delay=1.0, max_delay=30.0):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.pending = threading.BoundedSemaphore(max_pending or max_workers * 2)
+        self.stopping = threading.Event()
+
+    def submit(self, func, *args, **kwargs):
+        self.pending.acquire()
+        try:
+            future = self.executor.submit(self.run_with_retry, func, *args, **kwargs)
+        except BaseException:
+            self.pending.release()
+            raise
+        future.add_done_callback(lambda _: self.pending.release())
+        return future
+
+    def map(self, func, items):
+        futures = [self.submit(func, item) for item in items]
+        return [future.result() for future in futures]
+
+    def run_with_retry(self, func, *args, **kwargs):
+        attempt = 0
+        while True:
+            try:
+                return func(*args, **kwargs)
+            except Exception as e:
+                if attempt >= self.max_retries or self.stopping.is_set() or not is_transient(e):
+                    raise
+                delay = min(self.base_delay * 2 ** attempt, self.max_delay) * random.uniform(0.5, 1.0)
+                print(f"LLM 请求失败 ({e})，{delay:.1f} 秒后重试 ({attempt + 1}/{self.max_retries})")
+                # 退避期间被关闭时立即放弃
+                if self.stopping.wait(delay):
+                    raise
+                attempt += 1
+
+    def shutdown(self, wait=True, cancel_pending=False):
+        # wait 为真时等正在执行的任务结束；cancel_pending 为真或 wait 为假时取消排队的任务，
+        # 正在执行的任务失败后也不再重试
+        cancel = cancel_pending or not wait
+        if cancel:
+            self.stopping.set()
+        self.executor.shutdown(wait=wait, cancel_futures=cancel)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        # 出错或被中断（Ctrl+C）时取消排队的任务，但仍等正在执行的任务结束：
+        # 调用方随后要关闭这些任务写入的预处理日志，已经拿到的结果也不会丢
+        self.shutdown(wait=True, cancel_pending=exc_type is not None)
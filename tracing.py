@@ -0,0 +1,193 @@
+import functools
+import json
+import os
+import threading
+import time
+from collections import deque
+
+SPAN_BUFFER_SIZE = 10000
+# Prometheus 直方图的桶上界（毫秒）
+BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+METRIC_PREFIX = "ai_reader"
+# 只有这些后缀的数值属性（token 数、各段耗时）会被累加，页码之类的属性只出现在 JSONL 里
+SUMMED_SUFFIXES = ("_tokens", "_ms")
+
+
+class Span:
+    def __init__(self, name, parent, attributes):
+        self.name = name
+        self.parent = parent
+        self.attributes = attributes
+        self.start_time = time.time()
+        self.start = time.perf_counter()
+        self.duration_ms = None
+        self.error = None
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def to_json(self):
+        record = {"name": self.name, "parent": self.parent, "start": self.start_time,
+                  "duration_ms": self.duration_ms, "thread": threading.current_thread().name}
+        if self.error:
+            record["error"] = self.error
+        record.update(self.attributes)
+        return record
+
+
+class SpanStats:
+    # 同名 span 的累计值：次数、总耗时、直方图，以及数值属性（token 数等）的总和
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.buckets = [0] * len(BUCKETS_MS)
+        self.attribute_totals = {}
+
+    def add(self, span):
+        self.count += 1
+        self.errors += span.error is not None
+        self.total_ms += span.duration_ms
+        self.max_ms = max(self.max_ms, span.duration_ms)
+        for index, bound in enumerate(BUCKETS_MS):
+            if span.duration_ms <= bound:
+                self.buckets[index] += 1
+        for key, value in span.attributes.items():
+            if key.endswith(SUMMED_SUFFIXES) and isinstance(value, (int, float)) and not isinstance(value, bool):
+                self.attribute_totals[key] = self.attribute_totals.get(key, 0) + value
+
+
+class Tracer:
+    # 轻量的进程内追踪：span 记录一段操作的耗时和属性，counter 记录次数。
+    # 结束的 span 先放在有界缓冲里，由 export_jsonl 追加写出；累计值可导出为 Prometheus 文本格式。
+    def __init__(self, buffer_size=SPAN_BUFFER_SIZE):
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.finished = deque(maxlen=buffer_size)
+        self.stats = {}
+        self.counters = {}
+
+    def stack(self):
+        if not hasattr(self.local, "stack"):
+            self.local.stack = []
+        return self.local.stack
+
+    def span(self, name, **attributes):
+        return SpanContext(self, name, attributes)
+
+    def current(self):
+        stack = self.stack()
+        return stack[-1] if stack else None
+
+    def annotate(self, **attributes):
+        # 给当前线程最内层的 span 添加属性，没有 span 时什么也不做
+        span = self.current()
+        if span is not None:
+            span.set(**attributes)
+
+    def finish(self, span):
+        span.duration_ms = (time.perf_counter() - span.start) * 1000
+        with self.lock:
+            self.finished.append(span.to_json())
+            self.stats.setdefault(span.name, SpanStats()).add(span)
+
+    def record(self, name, start, **attributes):
+        # 记录一段已经结束的操作，start 为 time.perf_counter() 的读数；用于跨越多次 yield 的生成器
+        span = Span(name, None, attributes)
+        span.start_time -= time.perf_counter() - start
+        span.start = start
+        self.finish(span)
+
+    def count(self, name, value=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def summary(self):
+        # [(span 名, 次数, 平均毫秒, 最大毫秒, 数值属性总和)]，按总耗时从大到小
+        with self.lock:
+            rows = [(name, stats.count, stats.total_ms / stats.count, stats.max_ms, dict(stats.attribute_totals))
+                    for name, stats in self.stats.items()]
+            counters = dict(self.counters)
+        rows.sort(key=lambda row: row[1] * row[2], reverse=True)
+        return rows, counters
+
+    def export_jsonl(self, path):
+        with self.lock:
+            records = list(self.finished)
+            self.finished.clear()
+        if records:
+            with open(path, "a", encoding="utf-8") as f:
+                for record in records:
+                    f.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+        return len(records)
+
+    def export_prometheus(self, path):
+        lines = []
+        with self.lock:
+            for name, value in sorted(self.counters.items()):
+                metric = f"{METRIC_PREFIX}_{metric_name(name)}_total"
+                lines += [f"# TYPE {metric} counter", f"{metric} {value}"]
+            histogram = f"{METRIC_PREFIX}_span_duration_ms"
+            lines.append(f"# TYPE {histogram} histogram")
+            for name, stats in sorted(self.stats.items()):
+                for bound, bucket in zip(BUCKETS_MS, stats.buckets):
+                    lines.append(f'{histogram}_bucket{{span="{name}",le="{bound}"}} {bucket}')
+                lines.append(f'{histogram}_bucket{{span="{name}",le="+Inf"}} {stats.count}')
+                lines.append(f'{histogram}_sum{{span="{name}"}} {stats.total_ms}')
+                lines.append(f'{histogram}_count{{span="{name}"}} {stats.count}')
+            attributes = f"{METRIC_PREFIX}_span_attribute_total"
+            lines.append(f"# TYPE {attributes} counter")
+            for name, stats in sorted(self.stats.items()):
+                for key, value in sorted(stats.attribute_totals.items()):
+                    lines.append(f'{attributes}{{span="{name}",attribute="{key}"}} {value}')
+        # node_exporter 的 textfile 采集器可能随时读取，先写临时文件再替换
+        temporary_path = path + ".tmp"
+        with open(temporary_path, "w") as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(temporary_path, path)
+
+
+class SpanContext:
+    def __init__(self, tracer, name, attributes):
+        self.tracer = tracer
+        self.name = name
+        self.attributes = attributes
+        self.span = None
+
+    def __enter__(self):
+        stack = self.tracer.stack()
+        parent = stack[-1].name if stack else None
+        self.span = Span(self.name, parent, dict(self.attributes))
+        stack.append(self.span)
+        return self.span
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        stack = self.tracer.stack()
+        if stack and stack[-1] is self.span:
+            stack.pop()
+        if exc_type is not None:
+            self.span.error = exc_type.__name__
+        self.tracer.finish(self.span)
+        return False
+
+
+def metric_name(name):
+    return "".join(ch if ch.isalnum() else "_" for ch in name)
+
+
+tracer = Tracer()
+span = tracer.span
+annotate = tracer.annotate
+record = tracer.record
+count = tracer.count
+
+
+def traced(name):
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with tracer.span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,164 @@
+import hashlib
+import re
+import sqlite3
+import threading
+import time
+
+from tracing import count
+from utils import estimate_tokens
+
+TRANSLATION_MEMORY_PATH = "translation_memory.db"
+# 模糊匹配：字符 5-gram 的 MinHash 签名，分成 16 段各 4 行做 LSH，候选再用真实的 Jaccard 相似度确认
+SHINGLE_SIZE = 5
+MINHASH_PERMUTATIONS = 64
+LSH_BANDS = 16
+MINHASH_SEED = 1
+MINHASH_PRIME = (1 << 61) - 1
+# 相似度达到阈值后，还要求两句的词（含数字）逐个相同，只有引号、标点、大小写不同的句子才复用译文；
+# 长句里只改了一个数字或一个词时 Jaccard 也能超过阈值，直接复用会把错误的译文带到所有书里
+FUZZY_THRESHOLD = 0.95
+# 太短的句子只做精确匹配
+MIN_FUZZY_CHARS = 20
+QUOTES = str.maketrans({"“": '"', "”": '"', "‘": "'", "’": "'", "—": "-", "–": "-"})
+
+
+def normalize(sentence):
+    return " ".join(sentence.translate(QUOTES).split())
+
+
+def segment_key(sentence):
+    return hashlib.sha1(normalize(sentence).encode("utf-8")).hexdigest()
+
+
+def shingles(sentence):
+    text = normalize(sentence).lower()
+    return {text[i:i + SHINGLE_SIZE] for i in range(max(1, len(text) - SHINGLE_SIZE + 1))}
+
+
+def words(sentence):
+    return re.findall(r"\w+", sentence.lower())
+
+
+def jaccard(first, second):
+    return len(first & second) / len(first | second) if first or second else 1.0
+
+
+def format_stats(memories):
+    # 一本书的命中情况；集群预处理时每个节点各有一个 TranslationMemory，合在一起统计
+    exact_hits = sum(memory.exact_hits for memory in memories)
+    fuzzy_hits = sum(memory.fuzzy_hits for memory in memories)
+    lookups = exact_hits + fuzzy_hits + sum(memory.misses for memory in memories)
+    saved_tokens = sum(memory.saved_tokens for memory in memories)
+    hit_rate = (exact_hits + fuzzy_hits) / lookups if lookups else 0.0
+    return (f"翻译记忆：{exact_hits + fuzzy_hits}/{lookups} 句命中（精确 {exact_hits}，模糊 {fuzzy_hits}，"
+            f"命中率 {hit_rate:.0%}），约省下 {saved_tokens} 个 token")
+
+
+class MinHasher:
+    # 哈希函数 (a * x + b) mod p 的参数由固定种子生成，签名在不同进程、不同机器上保持一致
+    def __init__(self, permutations=MINHASH_PERMUTATIONS, seed=MINHASH_SEED):
+        import numpy as np
+        random_state = np.random.RandomState(seed)
+        self.a = random_state.randint(1, 1 << 31, size=permutations, dtype=np.int64).astype(np.uint64)
+        self.b = random_state.randint(0, 1 << 31, size=permutations, dtype=np.int64).astype(np.uint64)
+
+    def signature(self, shingle_set):
+        import numpy as np
+        # 每个 shingle 取 32 位哈希，与 31 位的 a 相乘不会超出 uint64
+        values = np.fromiter((int.from_bytes(hashlib.blake2b(shingle.encode("utf-8"), digest_size=4).digest(),
+                                             "little") for shingle in shingle_set),
+                             dtype=np.uint64, count=len(shingle_set))
+        return ((values[:, None] * self.a + self.b) % np.uint64(MINHASH_PRIME)).min(axis=0)
+
+    @staticmethod
+    def buckets(signature, bands=LSH_BANDS):
+        rows = len(signature) // bands
+        return [(band, hashlib.blake2b(signature[band * rows:(band + 1) * rows].tobytes(), digest_size=8).hexdigest())
+                for band in range(bands)]
+
+
+class TranslationMemory:
+    # 句子级的翻译记忆：英文句子 -> 中文译文，存放在 SQLite 中，所有文档共用。
+    # 先按规范化后的句子哈希精确查找；找不到且句子足够长时，用 MinHash LSH 找只有标点、大小写不同的句子。
+    # 换书时 reset_stats()，之后的计数就是这本书的命中率和省下的 token 数（见 format_stats）。
+    def __init__(self, path, fuzzy_threshold=FUZZY_THRESHOLD):
+        self.path = path
+        self.fuzzy_threshold = fuzzy_threshold
+        self.hasher = None
+        self.lock = threading.Lock()
+        # 多个节点的预处理线程可能同时写入
+        self.connection = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        with self.connection:
+            self.connection.execute("CREATE TABLE IF NOT EXISTS segments (key TEXT PRIMARY KEY, source TEXT NOT NULL, "
+                                    "target TEXT NOT NULL, created REAL NOT NULL)")
+            self.connection.execute("CREATE TABLE IF NOT EXISTS buckets (band INTEGER NOT NULL, bucket TEXT NOT NULL, "
+                                    "key TEXT NOT NULL)")
+            self.connection.execute("CREATE INDEX IF NOT EXISTS buckets_band_bucket ON buckets (band, bucket)")
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.exact_hits = 0
+        self.fuzzy_hits = 0
+        self.misses = 0
+        self.saved_tokens = 0
+
+    def signature_buckets(self, sentence):
+        if self.hasher is None:
+            self.hasher = MinHasher()
+        return MinHasher.buckets(self.hasher.signature(shingles(sentence)))
+
+    def find_similar(self, sentence):
+        candidates = set()
+        for band, bucket in self.signature_buckets(sentence):
+            candidates.update(row[0] for row in self.connection.execute(
+                "SELECT key FROM buckets WHERE band = ? AND bucket = ?", (band, bucket)))
+        best, best_score = None, self.fuzzy_threshold
+        query_shingles = shingles(sentence)
+        query_words = words(sentence)
+        for key in candidates:
+            source, target = self.connection.execute("SELECT source, target FROM segments WHERE key = ?",
+                                                     (key,)).fetchone()
+            score = jaccard(query_shingles, shingles(source))
+            if score >= best_score and words(source) == query_words:
+                best, best_score = target, score
+        return best
+
+    def lookup(self, sentence):
+        # 返回译文，没有时返回 None；命中时按原句和译文估算省下的 prompt 与输出 token
+        with self.lock:
+            row = self.connection.execute("SELECT target FROM segments WHERE key = ?",
+                                          (segment_key(sentence),)).fetchone()
+            target = row[0] if row is not None else None
+            if target is not None:
+                self.exact_hits += 1
+                count("translation_memory.exact_hits")
+            elif len(sentence) >= MIN_FUZZY_CHARS:
+                target = self.find_similar(sentence)
+                if target is not None:
+                    self.fuzzy_hits += 1
+                    count("translation_memory.fuzzy_hits")
+            if target is None:
+                self.misses += 1
+                count("translation_memory.misses")
+                return None
+            saved_tokens = estimate_tokens(sentence) + estimate_tokens(target)
+            self.saved_tokens += saved_tokens
+            count("translation_memory.saved_tokens", saved_tokens)
+            return target
+
+    def add(self, sentence, target):
+        key = segment_key(sentence)
+        buckets = self.signature_buckets(sentence) if len(sentence) >= MIN_FUZZY_CHARS else []
+        with self.lock:
+            with self.connection:
+                cursor = self.connection.execute("INSERT OR IGNORE INTO segments (key, source, target, created) "
+                                                 "VALUES (?, ?, ?, ?)", (key, sentence, target, time.time()))
+                if cursor.rowcount:
+                    self.connection.executemany("INSERT INTO buckets (band, bucket, key) VALUES (?, ?, ?)",
+                                                [(band, bucket, key) for band, bucket in buckets])
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
@@ -1,6 +1,12 @@
-import fitz  # PyMuPDF
 import re
-import GPUtil
+import json
+from extraction import extract_page_blocks
+
+# 英文句末标点（后面可以跟引号或右括号）后跟空白处可能断句，中文句末标点后直接断句
+SENTENCE_BOUNDARY = re.compile(r'[.!?]["”’)]?\s+|[。！？]')
+# 句点后面不断句的缩写（小写，不含末尾的句点）；U.S.、e.g. 这类带内部句点的缩写另外判断
+ABBREVIATIONS = {"mr", "mrs", "ms", "dr", "st", "prof", "jr", "sr", "vs", "no", "fig", "vol", "gen", "gov", "sen",
+                 "rep", "inc", "ltd", "co", "corp", "mt", "ft", "approx", "cf", "al"}
 
 
 def filter_english_and_punctuation(text):
@@ -13,22 +19,23 @@ def filter_english_and_punctuation(text):
     return filtered_text
 
 
-def extract_paragraphs_with_page_breaks(pdf_path, start_page):
+def extract_paragraphs_with_page_breaks(pdf_path, start_page, workers=None):
+    import fitz  # PyMuPDF
+
     # 打开 PDF 文件
     doc = fitz.open(pdf_path)
+    page_count = doc.page_count
+    doc.close()
 
     paragraph_list = []
     paragraph = ""
 
-    # 遍历所有页面
-    for page_index in range(start_page, doc.page_count):
-        page = doc.load_page(page_index)
-
-        # 获取页面的文本块
-        blocks = page.get_text("blocks")
-
+    # 并行获取所有页面的文本块，再按页序拼接段落
+    page_indices = range(start_page, page_count)
+    page_blocks = extract_page_blocks(pdf_path, page_indices, workers=workers)
+    for page_index, blocks in zip(page_indices, page_blocks):
         for block_index, block in enumerate(blocks):
-            text = filter_english_and_punctuation(block[4]).strip() # 获取文本内容并去掉前后空白
+            text = filter_english_and_punctuation(block).strip() # 获取文本内容并去掉前后空白
 
             if text == "":
                 continue
@@ -55,7 +62,102 @@ def replace_multiple_spaces_with_one(text):
     return re.sub(r'\s+', ' ', text)
 
 
+def parse_summaries(text, summary_lengths):
+    # 解析模型返回的 {"100": "...", "200": "...", "300": "..."}，并尽量修复常见的格式错误：
+    # markdown 代码块、JSON 前后的多余文字、尾随逗号、键写成 "100字" 之类、JSON 被截断等
+    text = re.sub(r"```(?:json)?", "", text)
+    start = text.find("{")
+    end = text.rfind("}")
+    candidate = text[start:end + 1] if start != -1 and end > start else text[start + 1:] if start != -1 else text
+    candidate = re.sub(r",\s*}", "}", candidate)
+    try:
+        data = json.loads(candidate, strict=False)
+        items = data.items() if isinstance(data, dict) else []
+    except json.JSONDecodeError:
+        # 逐个提取完整的键值对，被截断的最后一项丢弃
+        items = [(key, json.loads(f'"{value}"', strict=False))
+                 for key, value in re.findall(r'"([^"]*\d+[^"]*)"\s*:\s*"((?:[^"\\]|\\.)*)"', candidate)]
+    summaries = {}
+    for key, value in items:
+        match = re.search(r"\d+", str(key))
+        if match is None or not isinstance(value, str):
+            continue
+        length = int(match.group())
+        value = replace_multiple_spaces_with_one(value).strip()
+        if length in summary_lengths and value:
+            summaries[length] = value
+    return summaries
+
+
+def number_segments(paragraph_list):
+    # 编号用 <<n>>：正文里常见 [3] 这样的引用标注，用方括号编号时会被当成段号，整批对不上
+    return "".join(f"\n<<{index}>> {paragraph}" for index, paragraph in enumerate(paragraph_list, start=1))
+
+
+def parse_numbered_segments(text, segment_count):
+    # 解析 "<<1>> ... <<2>> ..." 格式的输出；编号必须恰好是 1..segment_count 且按顺序出现，否则返回 None。
+    # 小模型常在 <<1>> 前加一句“以下是翻译：”之类的开场白，这部分忽略
+    parts = re.split(r"<<\s*(\d+)\s*>>", text)
+    numbers = [int(number) for number in parts[1::2]]
+    if numbers != list(range(1, segment_count + 1)):
+        return None
+    segments = [replace_multiple_spaces_with_one(segment).strip() for segment in parts[2::2]]
+    if not all(segments):
+        return None
+    return segments
+
+
+def pack_paragraphs(paragraph_list, token_budget, max_segments):
+    # 把相邻的段落装进若干批，每批的估算 token 数不超过 token_budget（单个超长段落单独成批）
+    batches = []
+    batch = []
+    batch_tokens = 0
+    for paragraph in paragraph_list:
+        tokens = estimate_tokens(paragraph)
+        if batch and (batch_tokens + tokens > token_budget or len(batch) >= max_segments):
+            batches.append(batch)
+            batch = []
+            batch_tokens = 0
+        batch.append(paragraph)
+        batch_tokens += tokens
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+def is_sentence_end(paragraph, boundary):
+    # 下一个词小写开头时不是句末；句点前是单个大写字母（人名缩写，如 Thomas J.）或常见缩写时也不是
+    if boundary.group()[0] in "。！？":
+        return True
+    if paragraph[boundary.end():boundary.end() + 1].islower():
+        return False
+    if boundary.group()[0] == ".":
+        word = re.search(r"[\w.]*$", paragraph[:boundary.start()]).group()
+        if re.fullmatch(r"[A-Z]|(?:[A-Za-z]\.)+[A-Za-z]", word) or word.lower() in ABBREVIATIONS:
+            return False
+    return True
+
+
+def split_sentences(paragraph):
+    sentences = []
+    start = 0
+    for boundary in SENTENCE_BOUNDARY.finditer(paragraph):
+        if is_sentence_end(paragraph, boundary):
+            sentences.append(paragraph[start:boundary.end()].strip())
+            start = boundary.end()
+    sentences.append(paragraph[start:].strip())
+    return [sentence for sentence in sentences if sentence]
+
+
+def estimate_tokens(text):
+    # 不依赖具体模型分词器的粗略估算：中日韩文字约一字一个 token，其余约四个字符一个 token
+    cjk_count = len(re.findall(r'[\u3000-\u303f\u4e00-\u9fff\uff00-\uffef]', text))
+    return cjk_count + (len(text) - cjk_count + 3) // 4
+
+
 def check_integrated_gpu():
+    import GPUtil
+
     integrated_gpu = False
     for device in GPUtil.getGPUs():
         if device.name.lower() == 'intel':
@@ -65,6 +167,9 @@ def check_integrated_gpu():
 
 
 def get_gpu_info():
+    # GPUtil 查询显卡要调用 nvidia-smi，用到时才导入
+    import GPUtil
+
     gpus = GPUtil.getGPUs()
     if not gpus:
         return None  # 没有找到可用的显卡
@@ -88,7 +193,7 @@ def print_gpu_info():
 
     print(f"是否有集成显卡: {'是' if has_integrated_gpu else '否'}")
     print("显卡信息:")
-    for info in gpu_info:
+    for info in gpu_info or []:
         print(f"名称: {info['name']}, 显存总量: {info['memoryTotal']} MB, "
               f"显存已用: {info['memoryUsed']} MB, "
               f"显存剩余: {info['memoryFree']} MB, "